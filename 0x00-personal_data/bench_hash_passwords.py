@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Benchmark: hash_passwords/verify_many against serial loops
+"""
+from os import cpu_count
+import time
+
+encrypt_password = __import__('encrypt_password')
+
+PASSWORDS = ["MyAmazingPassw0rd{}".format(i) for i in range(32)]
+WORKERS = cpu_count() or 1
+
+
+def timed(label: str, func) -> float:
+    """ Prints and returns the seconds func takes """
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    print("{:<24} {:7.3f}s".format(label, seconds))
+    return seconds
+
+
+print("bcrypt cost {}, {} workers".format(encrypt_password.get_rounds(),
+                                          WORKERS))
+serial = timed("serial hash", lambda: [
+    encrypt_password.hash_password(p) for p in PASSWORDS])
+pooled = timed("hash_passwords", lambda: list(
+    encrypt_password.hash_passwords(PASSWORDS, workers=WORKERS)))
+print("speedup {:.2f}x".format(serial / pooled))
+
+hashes = list(encrypt_password.hash_passwords(PASSWORDS, workers=WORKERS))
+pairs = list(zip(hashes, PASSWORDS))
+serial = timed("serial is_valid", lambda: [
+    encrypt_password.is_valid(h, p) for h, p in pairs])
+pooled = timed("verify_many", lambda: list(
+    encrypt_password.verify_many(pairs, workers=WORKERS)))
+print("speedup {:.2f}x".format(serial / pooled))
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark: RedactingFormatter on a pre-rendered message (regex path)
+against a row mapping (lookup path), as text and as JSON lines
+"""
+import logging
+import timeit
+
+filtered_logger = __import__('filtered_logger')
+RedactingFormatter = filtered_logger.RedactingFormatter
+PII_FIELDS = filtered_logger.PII_FIELDS
+
+ROW = {
+    'name': "Marlene Wood", 'email': "hwestiii@att.net",
+    'phone': "(473) 401-4253", 'ssn': "261-72-6780", 'password': "K5?BMNv",
+    'ip': "60ed:c396:2ff:244:bbd0:9208:26f2:93ea",
+    'last_login': "2019-11-14 06:14:24",
+    'user_agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
+}
+NUMBER = 50000
+
+
+def record(msg) -> logging.LogRecord:
+    """ Builds a log record the way logger.info would """
+    return logging.LogRecord("user_data", logging.INFO, __file__, 0, msg,
+                             None, None)
+
+
+def regex_path(formatter: RedactingFormatter) -> str:
+    """ Renders the row to a string, then lets the regex redact it """
+    message = 'name={}; email={}; phone={}; ssn={}; password={}; ip={}; '\
+        'last_login={}; user_agent={};'.format(*ROW.values())
+    return formatter.format(record(message))
+
+
+def structured_path(formatter: RedactingFormatter) -> str:
+    """ Hands the row mapping to the formatter """
+    return formatter.format(record(ROW))
+
+
+text = RedactingFormatter(PII_FIELDS)
+json_lines = RedactingFormatter(PII_FIELDS, json_lines=True)
+assert regex_path(text).split(": ", 1)[1] == \
+    structured_path(text).split(": ", 1)[1]
+
+for label, func, formatter in (("regex text", regex_path, text),
+                               ("mapping text", structured_path, text),
+                               ("regex json", regex_path, json_lines),
+                               ("mapping json", structured_path, json_lines)):
+    seconds = min(timeit.repeat(lambda: func(formatter),
+                                number=NUMBER, repeat=5))
+    print("{:<13} {:8.3f} us/record".format(label, seconds / NUMBER * 1e6))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+""" Pooling database connections """
+
+from typing import Callable, Optional
+import sqlite3
+import threading
+import time
+import weakref
+
+
+class PooledConnection:
+    """ Connection checked out of a ConnectionPool
+    Behaves like the wrapped connection, but close() hands it back
+    to the pool instead of closing it; so does garbage collection
+    when close() is never called
+    """
+
+    def __init__(self, pool: 'ConnectionPool', connection):
+        """ inits class instance """
+        self._pool = pool
+        self._connection = connection
+        self._release = weakref.finalize(self, pool.release, connection)
+        self._release.atexit = False
+
+    def __getattr__(self, name: str):
+        """ delegates to the wrapped connection """
+        if self._connection is None:
+            raise AttributeError("connection was returned to its pool")
+        return getattr(self._connection, name)
+
+    def close(self) -> None:
+        """ returns the connection to its pool """
+        if self._connection is not None:
+            self._connection = None
+            self._release()
+
+    def __enter__(self) -> 'PooledConnection':
+        """ context manager entry """
+        return self
+
+    def __exit__(self, *exc) -> None:
+        """ context manager exit """
+        self.close()
+
+
+class ConnectionPool:
+    """ Fixed size pool of connections made by factory """
+
+    def __init__(self, factory: Callable, size: int = 5,
+                 timeout: Optional[float] = None):
+        """ inits class instance """
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._opened = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._replaced = 0
+        # reentrant: the release of a collected PooledConnection
+        # may run while this thread holds it
+        self._cond = threading.Condition(threading.RLock())
+
+    @staticmethod
+    def is_healthy(connection) -> bool:
+        """ True if the connection can still be used """
+        is_connected = getattr(connection, 'is_connected', None)
+        if is_connected is None:
+            return True
+        try:
+            return bool(is_connected())
+        except Exception:
+            return False
+
+    def get(self) -> PooledConnection:
+        """ Checks out an idle connection, opening one while the pool
+        has room, otherwise waits up to timeout for a release
+        """
+        start = time.perf_counter()
+        with self._cond:
+            if not self._idle and self._opened >= self.size:
+                self._waits += 1
+            while not self._idle and self._opened >= self.size:
+                remaining = None
+                if self.timeout is not None:
+                    remaining = self.timeout - (time.perf_counter() - start)
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            "no connection available after {}s".format(
+                                self.timeout))
+                self._cond.wait(remaining)
+            waited = time.perf_counter() - start
+            self._wait_time += waited
+            self._max_wait = max(self._max_wait, waited)
+            self._checkouts += 1
+            self._in_use += 1
+            connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                self._opened += 1
+        try:
+            if connection is not None and not self.is_healthy(connection):
+                self._discard(connection)
+                connection = None
+                with self._cond:
+                    self._replaced += 1
+            if connection is None:
+                connection = self.factory()
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, connection)
+
+    @staticmethod
+    def reset(connection) -> None:
+        """ Drops the unread results and rolls back the uncommitted
+        changes a connection was released with
+        """
+        if getattr(connection, 'unread_result', False):
+            connection.consume_results()
+        connection.rollback()
+
+    def release(self, connection) -> None:
+        """ Resets a checked out connection and puts it back in the
+        idle list, or closes it if it can't be reset
+        """
+        try:
+            self.reset(connection)
+        except Exception:
+            self._discard(connection)
+            connection = None
+        with self._cond:
+            self._in_use -= 1
+            if connection is None:
+                self._opened -= 1
+            else:
+                self._idle.append(connection)
+            self._cond.notify()
+
+    @staticmethod
+    def _discard(connection) -> None:
+        """ closes a connection, ignoring errors from a dead one """
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """ Closes every idle connection """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self) -> dict:
+        """ Returns usage and wait time statistics """
+        with self._cond:
+            return {
+                'size': self.size,
+                'opened': self._opened,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'max_wait': self._max_wait,
+                'replaced': self._replaced,
+            }
+
+
+class FakeConnection:
+    """ Stand-in for MySQLConnection backed by an in-memory sqlite db,
+    so pools can be exercised without a MySQL server
+    """
+
+    def __init__(self, **kwargs):
+        """ inits class instance """
+        self.kwargs = kwargs
+        self._db = sqlite3.connect(':memory:', check_same_thread=False)
+
+    def is_connected(self) -> bool:
+        """ True until the connection is closed """
+        return self._db is not None
+
+    def cursor(self, *args, **kwargs) -> sqlite3.Cursor:
+        """ returns a cursor on the in-memory db """
+        return self._db.cursor()
+
+    def commit(self) -> None:
+        """ commits the in-memory db """
+        self._db.commit()
+
+    def rollback(self) -> None:
+        """ rolls back the in-memory db """
+        self._db.rollback()
+
+    def close(self) -> None:
+        """ closes the in-memory db """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -1,17 +1,156 @@
 #!/usr/bin/env python3
 """ Encrypting pswds with bcrypt """
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from math import log2
+from os import cpu_count, environ
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+import logging
+import time
 import bcrypt
 
+# bcrypt's own default: calibration can only raise the cost
+MIN_ROUNDS = 12
+MAX_ROUNDS = 31
+# about what a cost-12 hash takes on current hardware, so faster hosts
+# calibrate above the floor
+TARGET_MS = 250.0
+# cost timed by calibration, cheap enough to run at startup
+CALIBRATION_ROUNDS = 8
+
+_rounds = None
+logger = logging.getLogger(__name__)
+
+
+def calibrate_rounds(target_ms: float = TARGET_MS) -> int:
+    """ Benchmarks bcrypt on this host
+    Returns the highest cost whose hash stays under target_ms, or
+    MIN_ROUNDS if even that is over budget, which is logged as a
+    warning
+    """
+    salt = bcrypt.gensalt(CALIBRATION_ROUNDS)
+    elapsed = None
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibration', salt)
+        run = (time.perf_counter() - start) * 1000
+        elapsed = run if elapsed is None else min(elapsed, run)
+    # each extra round doubles the work
+    rounds = CALIBRATION_ROUNDS + int(log2(target_ms / elapsed))
+    if rounds < MIN_ROUNDS:
+        floor_ms = elapsed * 2 ** (MIN_ROUNDS - CALIBRATION_ROUNDS)
+        logger.warning("bcrypt cost %d takes about %.0f ms, over the "
+                       "%.0f ms target", MIN_ROUNDS, floor_ms, target_ms)
+    return min(MAX_ROUNDS, max(MIN_ROUNDS, rounds))
+
+
+def get_rounds() -> int:
+    """ Returns the bcrypt cost used for new hashes:
+    BCRYPT_ROUNDS if set, else calibrated once against
+    BCRYPT_TARGET_MS milliseconds per hash
+    Raises ValueError if BCRYPT_ROUNDS is out of bounds
+    """
+    global _rounds
+    if _rounds is None:
+        if environ.get("BCRYPT_ROUNDS"):
+            set_rounds(int(environ.get("BCRYPT_ROUNDS")))
+        else:
+            _rounds = calibrate_rounds(
+                float(environ.get("BCRYPT_TARGET_MS", TARGET_MS)))
+    return _rounds
+
+
+def set_rounds(rounds: int) -> None:
+    """ Overrides the bcrypt cost used for new hashes """
+    global _rounds
+    if not MIN_ROUNDS <= rounds <= MAX_ROUNDS:
+        raise ValueError("rounds must be between {} and {}".format(
+            MIN_ROUNDS, MAX_ROUNDS))
+    _rounds = rounds
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """ Returns the cost a bcrypt hash was made with """
+    return int(hashed_password.split(b'$')[2])
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """ True if the hash was made with less than the current cost
+    Callers check it after a successful is_valid and store a new
+    hash_password of the pswd when it is True
+    """
+    return hash_rounds(hashed_password) < get_rounds()
+
 
 def hash_password(password: str) -> bytes:
     """ Takes in string arg, converts to unicode
     Returns salted, hashed pswd as bytestring
     """
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode('utf-8'),
+                         bcrypt.gensalt(get_rounds()))
 
 
 def is_valid(hashed_password: bytes, password: str) -> bool:
     """ Checks if hashed and unhashed pswds are same
-    Returns bool
+    Returns bool; a matching hash below the current cost is logged as
+    a warning, see needs_rehash to upgrade it
+    """
+    valid = bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+    if valid and needs_rehash(hashed_password):
+        logger.warning("hash cost %d is below target %d, rehash it",
+                       hash_rounds(hashed_password), get_rounds())
+    return valid
+
+
+def _pop_finished(pending, ordered: bool) -> Iterator:
+    """ Pops and yields the next finished results of pending futures """
+    if ordered:
+        yield pending.popleft().result()
+        return
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        yield pending.pop(future), future.result()
+
+
+def _map_threads(func: Callable, args: Iterable[tuple],
+                 workers: Optional[int], ordered: bool) -> Iterator:
+    """ Runs func over args on a thread pool, keeping at most two calls
+    per worker in flight, and yields results as they finish:
+    in input order, or as (index, result) pairs when not ordered
+    """
+    workers = workers or cpu_count() or 1
+    with ThreadPoolExecutor(workers) as pool:
+        pending = deque() if ordered else {}
+        for index, arg in enumerate(args):
+            future = pool.submit(func, *arg)
+            if ordered:
+                pending.append(future)
+            else:
+                pending[future] = index
+            if len(pending) >= 2 * workers:
+                yield from _pop_finished(pending, ordered)
+        while pending:
+            yield from _pop_finished(pending, ordered)
+
+
+def hash_passwords(passwords: Iterable[str], workers: Optional[int] = None,
+                   ordered: bool = True) -> Iterator:
+    """ Hashes many pswds on a pool of workers threads
+    bcrypt releases the GIL, so hashes run in parallel
+    Yields hashes in input order, or (index, hash) as they finish
+    """
+    get_rounds()
+    return _map_threads(hash_password, ((password,)
+                                        for password in passwords),
+                        workers, ordered)
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]],
+                workers: Optional[int] = None,
+                ordered: bool = True) -> Iterator:
+    """ Runs is_valid over (hashed_password, password) pairs on a pool
+    of workers threads
+    Yields bools in input order, or (index, bool) as they finish
     """
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+    get_rounds()
+    return _map_threads(is_valid, pairs, workers, ordered)
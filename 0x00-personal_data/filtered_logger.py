@@ -1,18 +1,59 @@
 #!/usr/bin/env python3
 """ Protecting PII """
 
-from typing import List
+from functools import lru_cache, partial
+from logging.handlers import QueueHandler, QueueListener
+from typing import (Callable, Iterator, List, Mapping, Optional, Pattern,
+                    Tuple)
+import atexit
+import copy
+import csv
+import json
 import logging
+import queue
 import re
+import sqlite3
+import threading
 from mysql.connector import connection
 from os import environ
 
+from db_pool import ConnectionPool
+
 PII_FIELDS = ('name', 'email', 'password', 'ssn', 'phone')
+USER_COLUMNS = ('name', 'email', 'phone', 'ssn', 'password', 'ip',
+                'last_login', 'user_agent')
+USER_DATA_CSV = 'user_data.csv '
 
+db_pool = None
+db_pool_lock = threading.Lock()
 
-def filter_datum(fields: List[str], redaction: str,
-                 message: str, separator: str) -> str:
-    """ returns the log message obfuscated """
+
+def _is_literal(text: str) -> bool:
+    """ True if text matches itself when used as a regex """
+    return re.escape(text) == text
+
+
+@lru_cache(maxsize=128)
+def compile_redaction(fields: Tuple[str, ...],
+                      separator: str) -> Optional[Pattern]:
+    """ Compiles every field and the separator into one pattern
+    Returns None when the fields or separator only make sense
+    as regexes, in which case filter_datum has to run one pass
+    per field to keep its output unchanged
+    """
+    if not fields or len(separator) != 1 or separator == '=' \
+            or not _is_literal(separator):
+        return None
+    for field in fields:
+        if not field or not _is_literal(field) or '=' in field \
+                or separator in field:
+            return None
+    return re.compile("(" + "|".join(fields) + ")=.*?" + separator)
+
+
+def _filter_datum_per_field(fields: List[str], redaction: str,
+                            message: str, separator: str) -> str:
+    """ Obfuscates the message with one re.sub per field """
     temp = message
     for field in fields:
         temp = re.sub(field + "=.*?" + separator,
@@ -20,74 +61,287 @@ def filter_datum(fields: List[str], redaction: str,
     return temp
 
 
-def get_logger() -> logging.Logger:
-    """ Returns logger obj  """
+@lru_cache(maxsize=128)
+def _redactor(fields: Tuple[str, ...], redaction: str,
+              separator: str) -> Optional[Callable[[str], str]]:
+    """ Returns a callable redacting a message in a single pass,
+    or None when the per field passes are needed
+    """
+    pattern = compile_redaction(fields, separator)
+    if pattern is None or '\\' in redaction or '=' in redaction \
+            or separator in redaction or '\n' in redaction:
+        return None
+    masked = {field: field + "=" + redaction + separator for field in fields}
+    return partial(pattern.sub, lambda match: masked[match.group(1)])
+
+
+def filter_datum(fields: List[str], redaction: str,
+                 message: str, separator: str) -> str:
+    """ returns the log message obfuscated """
+    fields = tuple(fields)
+    redact = _redactor(fields, redaction, separator)
+    if redact is None:
+        return _filter_datum_per_field(fields, redaction, message, separator)
+    return redact(message)
+
+
+def get_logger(async_mode: bool = False, queue_size: int = 10000,
+               overflow: str = 'block',
+               json_lines: bool = False) -> logging.Logger:
+    """ Returns logger obj
+    In async_mode records go through a bounded queue and are redacted
+    and written by a background listener thread
+    The handlers of a previous call are replaced, their listener stopped
+    """
     logger = logging.getLogger('user_data')
     logger.setLevel(logging.INFO)
     logger.propagate = False
+    clear_handlers(logger)
 
     stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
-    logger.addHandler(stream_handler)
+    stream_handler.setFormatter(RedactingFormatter(PII_FIELDS, json_lines))
+    if not async_mode:
+        logger.addHandler(stream_handler)
+        return logger
+
+    log_queue = queue.Queue(queue_size)
+    queue_handler = BoundedQueueHandler(log_queue, overflow)
+    queue_handler.listener = DrainingQueueListener(
+        log_queue, stream_handler, respect_handler_level=True)
+    queue_handler.listener.start()
+    logger.addHandler(queue_handler)
+    atexit.register(stop_async_handler, logger, queue_handler)
     return logger
 
 
+def stop_async_handler(logger: logging.Logger,
+                       handler: 'BoundedQueueHandler') -> None:
+    """ Detaches an async handler and flushes its queued records """
+    logger.removeHandler(handler)
+    if handler.listener is not None:
+        handler.listener.stop()
+        handler.listener = None
+
+
+def clear_handlers(logger: logging.Logger) -> None:
+    """ Detaches every handler of logger, stopping the async ones """
+    for handler in list(logger.handlers):
+        if isinstance(handler, BoundedQueueHandler):
+            stop_async_handler(logger, handler)
+        else:
+            logger.removeHandler(handler)
+    # get_logger registers one hook per async handler, all now stopped
+    atexit.unregister(stop_async_handler)
+
+
+def _db_settings() -> dict:
+    """ Reads the connection settings from environmental vars """
+    return {
+        'user': environ.get("PERSONAL_DATA_DB_USERNAME", "root"),
+        'password': environ.get("PERSONAL_DATA_DB_PASSWORD", ""),
+        'host': environ.get("PERSONAL_DATA_DB_HOST", "localhost"),
+        'database': environ.get("PERSONAL_DATA_DB_NAME"),
+    }
+
+
 def get_db() -> connection.MySQLConnection:
     """
     Connect to mysql server with environmental vars
+    Checks the connection out of a pool when PERSONAL_DATA_DB_POOL_SIZE
+    is set; closing it then returns it to the pool
     """
-    username = environ.get("PERSONAL_DATA_DB_USERNAME", "root")
-    password = environ.get("PERSONAL_DATA_DB_PASSWORD", "")
-    db_host = environ.get("PERSONAL_DATA_DB_HOST", "localhost")
-    db_name = environ.get("PERSONAL_DATA_DB_NAME")
-    connector = connection.MySQLConnection(
-        user=username,
-        password=password,
-        host=db_host,
-        database=db_name)
+    if int(environ.get("PERSONAL_DATA_DB_POOL_SIZE", 0)) > 0:
+        return get_db_pool().get()
+    connector = connection.MySQLConnection(**_db_settings())
     return connector
 
 
+def get_db_pool() -> ConnectionPool:
+    """
+    Returns the shared pool get_db checks connections out of,
+    creating it from the environmental vars on first use
+    """
+    global db_pool
+    if db_pool is None:
+        with db_pool_lock:
+            if db_pool is None:
+                timeout = environ.get("PERSONAL_DATA_DB_POOL_TIMEOUT")
+                db_pool = ConnectionPool(
+                    partial(connection.MySQLConnection, **_db_settings()),
+                    size=int(environ.get("PERSONAL_DATA_DB_POOL_SIZE", 5)),
+                    timeout=float(timeout) if timeout else None)
+    return db_pool
+
+
+def get_sqlite_db(csv_path: str = USER_DATA_CSV,
+                  db_path: str = ":memory:") -> sqlite3.Connection:
+    """
+    Local stand-in for get_db: a sqlite users table loaded from csv
+    """
+    db = sqlite3.connect(db_path)
+    db.execute('CREATE TABLE IF NOT EXISTS users ({});'.format(
+        ', '.join(USER_COLUMNS)))
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        db.executemany('INSERT INTO users VALUES ({});'.format(
+            ', '.join('?' * len(USER_COLUMNS))), reader)
+    db.commit()
+    return db
+
+
+def iter_rows(cursor, batch_size: int) -> Iterator[tuple]:
+    """ Yields the rows of an executed cursor batch_size at a time """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
 class RedactingFormatter(logging.Formatter):
-    """ Redacting Formatter class """
+    """ Redacting Formatter class
+    A mapping passed as the log message is masked by key lookup and
+    rendered as 'key=value;' pairs once, skipping the regex pass
+    """
 
     REDACTION = "***"
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
 
-    def __init__(self, fields: List[str]):
+    def __init__(self, fields: List[str], json_lines: bool = False):
         """ inits class instance """
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.json_lines = json_lines
+        self._masked = frozenset(fields)
+
+    def mask(self, data: Mapping) -> dict:
+        """ returns a copy of data with the PII fields redacted """
+        return {key: self.REDACTION if key in self._masked else value
+                for key, value in data.items()}
+
+    def render(self, data: Mapping) -> str:
+        """ renders data as redacted 'key=value;' pairs """
+        masked, redaction = self._masked, self.REDACTION
+        return (self.SEPARATOR + " ").join([
+            "{}={}".format(key, redaction if key in masked else value)
+            for key, value in data.items()]) + self.SEPARATOR
 
     def format(self, record: logging.LogRecord) -> str:
         """ filters values in incoming log records """
-        return filter_datum(
-            self.fields, self.REDACTION, super(
-                RedactingFormatter, self).format(record),
-            self.SEPARATOR)
+        structured = isinstance(record.msg, Mapping) and not record.args
+        if self.json_lines:
+            return self.format_json(record, structured)
+        if not structured:
+            return filter_datum(
+                self.fields, self.REDACTION, super(
+                    RedactingFormatter, self).format(record),
+                self.SEPARATOR)
+        if record.exc_info or record.stack_info:
+            record = copy.copy(record)
+            record.msg = self.render(record.msg)
+            return super(RedactingFormatter, self).format(record)
+        # what logging.Formatter.format does, minus str() of the mapping
+        record.message = self.render(record.msg)
+        if self.usesTime():
+            record.asctime = self.formatTime(record, self.datefmt)
+        return self.formatMessage(record)
+
+    def format_json(self, record: logging.LogRecord,
+                    structured: bool) -> str:
+        """ renders the record as one JSON object """
+        if structured:
+            message = self.mask(record.msg)
+        else:
+            message = filter_datum(self.fields, self.REDACTION,
+                                   record.getMessage(), self.SEPARATOR)
+        line = {
+            'name': record.name,
+            'levelname': record.levelname,
+            'asctime': self.formatTime(record),
+            'message': message,
+        }
+        if record.exc_info:
+            line['exc_text'] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """ Queue handler with an overflow policy for a bounded queue """
+
+    OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = 'block'):
+        """ inits class instance """
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}".format(
+                ', '.join(self.OVERFLOW_POLICIES)))
+        super(BoundedQueueHandler, self).__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+        self.listener = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """ leaves formatting and redaction to the listener thread """
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """ queues the record, applying the overflow policy when full """
+        if self.overflow == 'block':
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                if self.overflow == 'drop_newest':
+                    self._count_drop()
+                    return
+            try:
+                self.queue.get_nowait()
+                self._count_drop()
+            except queue.Empty:
+                pass
+
+    def _count_drop(self) -> None:
+        """ counts one dropped record """
+        with self.lock:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """ Queue listener whose stop waits for room in a full queue """
+
+    def enqueue_sentinel(self) -> None:
+        """ blocks until the stop sentinel is queued behind every record """
+        self.queue.put(self._sentinel)
 
 
 def main() -> None:
     """
     Obtain a database connection using get_db
-    and retrieve all rows in the users table and display each row
+    and stream all rows in the users table, logging each row
     """
-    db = get_db()
+    if environ.get("PERSONAL_DATA_DB_ENGINE") == "sqlite":
+        db = get_sqlite_db()
+    else:
+        db = get_db()
+    batch_size = int(environ.get("PERSONAL_DATA_BATCH_SIZE", 1000))
+    # mysql.connector cursors are unbuffered unless asked otherwise,
+    # so rows stay on the server until fetchmany pulls the next batch
     cur = db.cursor()
 
     query = ('SELECT * FROM users;')
     cur.execute(query)
-    fetch_data = cur.fetchall()
+    columns = [column[0] for column in cur.description]
 
-    logger = get_logger()
+    logger = get_logger(
+        json_lines=environ.get("PERSONAL_DATA_LOG_FORMAT") == "json")
 
-    for row in fetch_data:
-        fields = 'name={}; email={}; phone={}; ssn={}; password={}; ip={}; '\
-            'last_login={}; user_agent={};'
-        fields = fields.format(row[0], row[1], row[2], row[3],
-                               row[4], row[5], row[6], row[7])
-        logger.info(fields)
+    for row in iter_rows(cur, batch_size):
+        logger.info(dict(zip(columns, row)))
 
     cur.close()
     db.close()
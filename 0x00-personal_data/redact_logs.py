@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+""" Redacting PII from large log files across a process pool """
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, Optional, Tuple
+import argparse
+import mmap
+import os
+import sys
+import time
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+_input = None
+
+
+def chunk_bounds(data: mmap.mmap,
+                 chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[int, int]]:
+    """ Yields (start, end) offsets of chunks ending on a line boundary """
+    start = 0
+    size = len(data)
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            end = size
+        else:
+            newline = data.find(b'\n', end - 1)
+            end = size if newline == -1 else newline + 1
+        yield start, end
+        start = end
+
+
+def _open_input(path: str) -> None:
+    """ Maps the input file once per worker process """
+    global _input
+    with open(path, 'rb') as f:
+        _input = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def redact_chunk(start: int, end: int, fields: Tuple[str, ...],
+                 redaction: str, separator: str) -> bytes:
+    """ Returns the redacted bytes of one chunk of the mapped input """
+    text = _input[start:end].decode('utf-8', 'surrogateescape')
+    return filter_datum(fields, redaction, text, separator).encode(
+        'utf-8', 'surrogateescape')
+
+
+def redact_file(path: str, output: BinaryIO, fields: Tuple[str, ...],
+                redaction: str, separator: str,
+                workers: Optional[int] = None,
+                chunk_size: int = CHUNK_SIZE) -> int:
+    """ Redacts path into output, in order, and returns the bytes read
+    Workers read their chunk straight from the mapped file, and at most
+    two chunks per worker are in flight so memory stays bounded
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    workers = workers or os.cpu_count() or 1
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+            ProcessPoolExecutor(workers, initializer=_open_input,
+                                initargs=(path,)) as pool:
+        pending = deque()
+        for start, end in chunk_bounds(data, chunk_size):
+            pending.append(pool.submit(redact_chunk, start, end, fields,
+                                       redaction, separator))
+            if len(pending) >= 2 * workers:
+                output.write(pending.popleft().result())
+        while pending:
+            output.write(pending.popleft().result())
+    output.flush()
+    return size
+
+
+def main() -> None:
+    """ Command line entry point """
+    parser = argparse.ArgumentParser(
+        description="Redact PII fields from a log file")
+    parser.add_argument('input', help="log file to redact")
+    parser.add_argument('-o', '--output',
+                        help="redacted file (default: stdout)")
+    parser.add_argument('-w', '--workers', type=int,
+                        help="worker processes (default: cpu count)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="approximate chunk size in bytes")
+    parser.add_argument('--fields', default=','.join(PII_FIELDS),
+                        help="comma separated fields to redact")
+    parser.add_argument('--redaction', default=RedactingFormatter.REDACTION)
+    parser.add_argument('--separator', default=RedactingFormatter.SEPARATOR)
+    args = parser.parse_args()
+
+    fields = tuple(field for field in args.fields.split(',') if field)
+    start = time.perf_counter()
+    if args.output is None:
+        size = redact_file(args.input, sys.stdout.buffer, fields,
+                           args.redaction, args.separator, args.workers,
+                           args.chunk_size)
+    else:
+        with open(args.output, 'wb') as output:
+            size = redact_file(args.input, output, fields, args.redaction,
+                               args.separator, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    megabytes = size / (1024 * 1024)
+    print("{:.1f} MB in {:.2f}s ({:.1f} MB/s)".format(
+        megabytes, elapsed, megabytes / elapsed if elapsed else 0.0),
+        file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,27 +3,43 @@
 """
 import os
 import re
-from typing import List, TypeVar
+from functools import lru_cache
+from typing import List, Optional, Pattern, Tuple, TypeVar
 from flask import request
 
 
+@lru_cache(maxsize=32)
+def excluded_paths_pattern(excluded_paths: Tuple[str]) -> Optional[Pattern]:
+    """Compiles excluded paths into one pattern matching the start of
+    any path excluded by one of them, None if there are none.
+    Each excluded path is an alternative: '/a*' becomes '/a.*', and
+    both '/a/' and '/a' become '/a/*'.
+    """
+    patterns = []
+    for exclusion_path in map(lambda x: x.strip(), excluded_paths):
+        if exclusion_path[-1] == '*':
+            pattern = '{}.*'.format(exclusion_path[0:-1])
+        elif exclusion_path[-1] == '/':
+            pattern = '{}/*'.format(exclusion_path[0:-1])
+        else:
+            pattern = '{}/*'.format(exclusion_path)
+        patterns.append('(?:{})'.format(pattern))
+    if not patterns:
+        return None
+    return re.compile('|'.join(patterns))
+
+
 class Auth:
     """Authentication class.
     """
     def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
         """Checks if a path requires authentication.
+        The excluded paths are compiled once per distinct list.
         """
         if path is not None and excluded_paths is not None:
-            for exclusion_path in map(lambda x: x.strip(), excluded_paths):
-                pattern = ''
-                if exclusion_path[-1] == '*':
-                    pattern = '{}.*'.format(exclusion_path[0:-1])
-                elif exclusion_path[-1] == '/':
-                    pattern = '{}/*'.format(exclusion_path[0:-1])
-                else:
-                    pattern = '{}/*'.format(exclusion_path)
-                if re.match(pattern, path):
-                    return False
+            pattern = excluded_paths_pattern(tuple(excluded_paths))
+            if pattern is not None and pattern.match(path):
+                return False
         return True
 
     def authorization_header(self, request=None) -> str:
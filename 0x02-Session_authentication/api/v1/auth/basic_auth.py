@@ -1,14 +1,30 @@
 #!/usr/bin/env python3
 
 import base64
+import hashlib
+import hmac
+import os
 from typing import Tuple
 from api.v1.auth.auth import Auth
+from api.v1.auth.cache import TTLCache
 from models.user import User
 
+# the users of valid Authorization headers are cached for
+# BASIC_AUTH_CACHE_TTL seconds, at most BASIC_AUTH_CACHE_SIZE of them
+# (0 disables the cache)
+BASIC_AUTH_CACHE_SIZE = int(os.getenv('BASIC_AUTH_CACHE_SIZE', 1024))
+BASIC_AUTH_CACHE_TTL = float(os.getenv('BASIC_AUTH_CACHE_TTL', 300))
+
 
 class BasicAuth(Auth):
     """BasicAuth class for basic authentication"""
 
+    # Authorization header HMAC -> (user id, email, password hash);
+    # the HMAC key is random per process, so neither the header nor
+    # the password can be recovered from the cache
+    credentials_cache = TTLCache(BASIC_AUTH_CACHE_SIZE, BASIC_AUTH_CACHE_TTL)
+    _cache_key = os.urandom(32)
+
     def extract_base64_authorization_header(
             self, authorization_header: str) -> str:
         """
@@ -105,6 +121,43 @@ class BasicAuth(Auth):
 
         return user
 
+    def cached_user(self, key: bytes):
+        """
+        Retrieves the User cached for an Authorization header.
+
+        Args:
+            key: The credentials_key of the Authorization header.
+
+        Returns:
+            The cached User if it still has the email and password it
+            had when cached, otherwise None. A stale entry is dropped.
+        """
+        entry = self.credentials_cache.get(key)
+        if entry is None:
+            return None
+
+        user_id, email, password = entry
+        user = User.get(user_id)
+        if user is None or user.email != email or \
+                user.password != password:
+            self.credentials_cache.pop(key)
+            return None
+
+        return user
+
+    def credentials_key(self, auth_header: str) -> bytes:
+        """
+        Computes the cache key of an Authorization header.
+
+        Args:
+            auth_header: The Authorization header value.
+
+        Returns:
+            The HMAC-SHA256 of the header under the key of the process.
+        """
+        return hmac.new(self._cache_key, auth_header.encode(),
+                        hashlib.sha256).digest()
+
     def current_user(self, request=None):
         """
         Retrieves the User instance for a request using Basic Authentication.
@@ -122,6 +175,11 @@ class BasicAuth(Auth):
         if auth_header is None:
             return None
 
+        key = self.credentials_key(auth_header)
+        user = self.cached_user(key)
+        if user is not None:
+            return user
+
         base64_auth_header = \
             self.extract_base64_authorization_header(auth_header)
         if base64_auth_header is None:
@@ -131,3 +189,11 @@ class BasicAuth(Auth):
             base64_auth_header)
         if decoded_auth_header is None:
             return None
+
+        user_email, user_pwd = self.extract_user_credentials(
+            decoded_auth_header)
+        user = self.user_object_from_credentials(user_email, user_pwd)
+        if user is not None:
+            self.credentials_cache.set(
+                key, (user.id, user.email, user.password))
+        return user
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Bounded, expiring cache module for the authentication classes.
+"""
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+
+class TTLCache:
+    """Thread-safe mapping of at most maxsize entries, each expiring
+    ttl seconds after it was set (never if ttl is None).
+    The least recently used entry is evicted to make room for a new one.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        """Initializes an empty cache.
+        A maxsize of 0 or less disables it: nothing is ever stored.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (value, expiry time, approximate size in bytes)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Gets the value of key, or default if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and \
+                    entry[1] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        """Sets the value of key, evicting the least recently used
+        entries past maxsize.
+        """
+        if self.maxsize <= 0:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        size = sys.getsizeof(key) + sys.getsizeof((value, expires, 0)) + \
+            sys.getsizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires, size)
+            self._size += size
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Removes key and returns its value, or default if it is missing
+        or expired.
+        """
+        with self._lock:
+            entry = self._remove(key)
+        if entry is None or entry[1] is not None and \
+                entry[1] <= time.monotonic():
+            return default
+        return entry[0]
+
+    def purge(self) -> int:
+        """Removes the expired entries and returns their number.
+        """
+        if self.ttl is None:
+            return 0
+        now = time.monotonic()
+        expired = [key for key, (value, expires, size) in self._snapshot()
+                   if expires <= now]
+        removed = 0
+        with self._lock:
+            for key in expired:
+                # set again since the snapshot: no longer expired
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] <= now:
+                    self._remove(key)
+                    removed += 1
+            self.expirations += removed
+        return removed
+
+    def items(self) -> list:
+        """Lists the (key, value) pairs of the unexpired entries, least
+        recently used first.
+        """
+        now = time.monotonic()
+        return [(key, value)
+                for key, (value, expires, size) in self._snapshot()
+                if expires is None or expires > now]
+
+    def memory_size(self) -> int:
+        """Approximates the number of bytes held by the entries, from a
+        running total.
+        """
+        with self._lock:
+            return sys.getsizeof(self._entries) + self._size
+
+    def clear(self):
+        """Removes every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _snapshot(self) -> list:
+        """Copies the (key, entry) pairs, so that scanning them doesn't
+        hold the lock.
+        """
+        with self._lock:
+            return list(self._entries.items())
+
+    def _remove(self, key):
+        """Removes key (under the lock) and returns its entry, None if
+        it is missing.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[2]
+        return entry
+
+    def __len__(self) -> int:
+        """Number of entries, expired ones not yet removed included.
+        """
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Size and counters of the cache.
+        """
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
@@ -5,13 +5,14 @@ from uuid import uuid4
 from flask import request
 
 from .auth import Auth
+from .session_store import SessionStore
 from models.user import User
 
 
 class SessionAuth(Auth):
     """Session authentication class.
     """
-    user_id_by_session_id = {}
+    user_id_by_session_id = SessionStore()
 
     def create_session(self, user_id: str = None) -> str:
         """Creates a session id for the user.
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""In-memory session store module for the API.
+"""
+from collections.abc import MutableMapping
+import os
+
+from .cache import TTLCache
+
+# at most SESSION_STORE_SIZE sessions are kept, each for
+# SESSION_STORE_TTL seconds (0 keeps them until evicted)
+SESSION_STORE_SIZE = int(os.getenv('SESSION_STORE_SIZE', 100000))
+SESSION_STORE_TTL = float(os.getenv('SESSION_STORE_TTL', 86400))
+_MISSING = object()
+
+
+class SessionStore(MutableMapping):
+    """Session id -> session mapping of bounded size.
+    Sessions expire ttl seconds after being set; past maxsize, the least
+    recently used session is evicted.
+    """
+
+    def __init__(self, maxsize: int = SESSION_STORE_SIZE,
+                 ttl: float = SESSION_STORE_TTL):
+        """Initializes an empty store.
+        """
+        self._cache = TTLCache(maxsize, ttl or None)
+
+    def __getitem__(self, session_id: str):
+        """Gets the session of session_id, unless it has expired.
+        """
+        session = self._cache.get(session_id, _MISSING)
+        if session is _MISSING:
+            raise KeyError(session_id)
+        return session
+
+    def __setitem__(self, session_id: str, session):
+        """Sets the session of session_id, evicting the least recently
+        used session if the store is full.
+        """
+        self._cache.set(session_id, session)
+
+    def __delitem__(self, session_id: str):
+        """Removes the session of session_id.
+        """
+        if self._cache.pop(session_id, _MISSING) is _MISSING:
+            raise KeyError(session_id)
+
+    def __iter__(self):
+        """Iterates over the ids of the unexpired sessions, as of the
+        call.
+        """
+        return iter([session_id for session_id, _ in self._cache.items()])
+
+    def __len__(self) -> int:
+        """Number of sessions, expired ones not yet removed included
+        (see purge).
+        """
+        return len(self._cache)
+
+    def __repr__(self) -> str:
+        """Represents the unexpired sessions like a dict.
+        """
+        return repr(dict(self._cache.items()))
+
+    def purge(self) -> int:
+        """Removes the expired sessions and returns their number.
+        """
+        return self._cache.purge()
+
+    def stats(self) -> dict:
+        """Size, memory, hit, eviction and expiration counters of the
+        store.
+        """
+        stats = self._cache.stats()
+        stats['memory_bytes'] = self._cache.memory_size()
+        return stats
@@ -7,6 +7,7 @@ from flask import abort, jsonify, request
 
 from models.user import User
 from api.v1.views import app_views
+from api.v1.views.users import jsonify_users
 
 
 @app_views.route('/auth_session/login', methods=['POST'], strict_slashes=False)
@@ -31,7 +32,7 @@ def login() -> Tuple[str, int]:
     if users[0].is_valid_password(password):
         from api.v1.app import auth
         sessiond_id = auth.create_session(getattr(users[0], 'id'))
-        res = jsonify(users[0].to_json())
+        res = jsonify_users(users[0])
         res.set_cookie(os.getenv("SESSION_NAME"), sessiond_id)
         return res
     return jsonify({"error": "wrong password"}), 401
@@ -2,18 +2,76 @@
 """Module of Users views.
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, jsonify, request
 from models.user import User
 
 
+STREAM_CHUNK_SIZE = 100
+
+
+def jsonify_users(users) -> Response:
+    """JSON response of one User, or of a list of Users, built from
+    their cached JSON encoding
+    """
+    if isinstance(users, User):
+        body = users.to_json_bytes()
+    else:
+        body = b"[" + b",".join(user.to_json_bytes() for user in users) + b"]"
+    return Response(body + b"\n", mimetype='application/json')
+
+
+def stream_users(users) -> bytes:
+    """Yield the JSON array of users, STREAM_CHUNK_SIZE at a time
+    """
+    yield b"["
+    chunk = []
+    first = True
+    for user in users:
+        chunk.append(user.to_json_bytes())
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield (b"" if first else b",") + b",".join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield (b"" if first else b",") + b",".join(chunk)
+    yield b"]\n"
+
+
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """GET /api/v1/users
+    Query parameters:
+      - limit (optional): maximum number of Users.
+      - cursor (optional): id of the last User of the previous page.
+      - stream (optional): 1 to send the list in chunks.
+    With limit, cursor or stream, Users come in ascending id order;
+    with limit, the X-Next-Cursor header holds the cursor of the next
+    page, if any.
     Return:
       - list of all User objects JSON represented.
+      - 400 if limit isn't a positive integer.
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return jsonify({'error': "limit must be a positive integer"}), 400
+    if request.args.get('stream') == '1':
+        users = User.iter_sorted(cursor, limit)
+        response = Response(stream_users(users), mimetype='application/json')
+    elif limit is None and cursor is None:
+        response = jsonify_users(User.all())
+    else:
+        users = User.iter_sorted(cursor, limit)
+        response = jsonify_users(users)
+    next_cursor = User.next_cursor(cursor, limit)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -31,11 +89,11 @@ def view_one_user(user_id: str = None) -> str:
         if request.current_user is None:
             abort(404)
         else:
-            return jsonify(request.current_user.to_json())
+            return jsonify_users(request.current_user)
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    return jsonify_users(user)
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -88,12 +146,118 @@ def create_user() -> str:
             user.first_name = rj.get("first_name")
             user.last_name = rj.get("last_name")
             user.save()
-            return jsonify(user.to_json()), 201
+            return jsonify_users(user), 201
         except Exception as e:
             error_msg = "Can't create User: {}".format(e)
     return jsonify({'error': error_msg}), 400
 
 
+@app_views.route('/users/batch', methods=['POST'], strict_slashes=False)
+def create_users() -> str:
+    """POST /api/v1/users/batch
+    JSON body:
+      - list of Users to create, as for POST /api/v1/users, or to
+        update (with an id), as for PUT /api/v1/users/:id.
+    Every item is checked before anything is changed, then the valid
+    ones are applied and saved at once; the updates are undone if
+    they can't be saved.
+    Return:
+      - list of the result of each item: status 201 (created) or 200
+        (updated) with the User JSON represented, or status 400/404
+        with the error.
+      - 400 if the body isn't a list or the Users can't be saved.
+    """
+    try:
+        rj = request.get_json()
+    except Exception as e:
+        rj = None
+    if type(rj) is not list:
+        return jsonify({'error': "Wrong format"}), 400
+    results = []
+    users = []
+    updates = []
+    seen = set()
+    for item in rj:
+        result = {}
+        if type(item) is not dict:
+            result = {'status': 400, 'error': "Wrong format"}
+        elif item.get('id') is not None:
+            user = User.get(item.get('id'))
+            if user is None:
+                result = {'status': 404, 'error': "Not found"}
+            elif user.id in seen:
+                result = {'status': 400, 'error': "duplicate id"}
+            else:
+                seen.add(user.id)
+                for field in ('first_name', 'last_name'):
+                    if item.get(field) is not None:
+                        updates.append((user, field, item.get(field)))
+                result = {'status': 200, 'user': user}
+        elif item.get("email", "") == "":
+            result = {'status': 400, 'error': "email missing"}
+        elif item.get("password", "") == "":
+            result = {'status': 400, 'error': "password missing"}
+        else:
+            user = User()
+            user.email = item.get("email")
+            user.password = item.get("password")
+            user.first_name = item.get("first_name")
+            user.last_name = item.get("last_name")
+            result = {'status': 201, 'user': user}
+        if 'user' in result:
+            users.append(result['user'])
+        results.append(result)
+    previous = [(user, field, getattr(user, field))
+                for user, field, value in updates]
+    for user, field, value in updates:
+        setattr(user, field, value)
+    try:
+        User.bulk_save(users)
+    except Exception as e:
+        for user, field, value in reversed(previous):
+            setattr(user, field, value)
+        return jsonify({'error': "Can't save Users: {}".format(e)}), 400
+    for result in results:
+        if 'user' in result:
+            result['user'] = result['user'].to_json()
+    return jsonify(results), 200
+
+
+@app_views.route('/users/batch', methods=['DELETE'], strict_slashes=False)
+def delete_users() -> str:
+    """DELETE /api/v1/users/batch
+    JSON body:
+      - list of User IDs.
+    Return:
+      - list of the result of each ID: status 200, or status 404
+        with the error if the User ID doesn't exist, or 400 if it is
+        repeated.
+      - 400 if the body isn't a list or the Users can't be removed.
+    """
+    try:
+        rj = request.get_json()
+    except Exception as e:
+        rj = None
+    if type(rj) is not list:
+        return jsonify({'error': "Wrong format"}), 400
+    results = []
+    users = {}
+    for user_id in rj:
+        user = User.get(user_id) if type(user_id) is str else None
+        if user is None:
+            results.append({'status': 404, 'error': "Not found"})
+        elif user.id in users:
+            results.append({'status': 400, 'error': "duplicate id"})
+        else:
+            users[user.id] = user
+            results.append({'status': 200})
+    try:
+        User.bulk_remove(list(users.values()))
+    except Exception as e:
+        return jsonify({'error': "Can't remove Users: {}".format(e)}), 400
+    return jsonify(results), 200
+
+
 @app_views.route('/users/<user_id>', methods=['PUT'], strict_slashes=False)
 def update_user(user_id: str = None) -> str:
     """PUT /api/v1/users/:id
@@ -124,4 +288,4 @@ def update_user(user_id: str = None) -> str:
     if rj.get('last_name') is not None:
         user.last_name = rj.get('last_name')
     user.save()
-    return jsonify(user.to_json()), 200
+    return jsonify_users(user), 200
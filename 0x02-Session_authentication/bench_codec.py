@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+""" Benchmark: save_to_file/load_from_file of N users in each snapshot
+format (default 1000000, or the first argument)
+"""
+import os
+import sys
+import tempfile
+import time
+
+import models.base as base
+from models.user import User
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+os.chdir(tempfile.mkdtemp())
+User.load_from_file()
+for i in range(USERS):
+    user = User(email="user{}@hbtn.io".format(i), first_name="Bob",
+                last_name="Dylan")
+    user.password = "pwd"
+    base.DATA['User'][user.id] = user
+
+for snapshot_format in ('json', 'binary'):
+    base.SNAPSHOT_FORMAT = snapshot_format
+    start = time.perf_counter()
+    User.save_to_file()
+    saved = time.perf_counter() - start
+    start = time.perf_counter()
+    User.load_from_file()
+    loaded = time.perf_counter() - start
+    assert User.count() == USERS
+    print("{:<7} save {:6.2f}s  load {:6.2f}s  {:7.1f} MB".format(
+        snapshot_format, saved, loaded,
+        os.path.getsize(base._snapshot_path('User')) / 1e6))
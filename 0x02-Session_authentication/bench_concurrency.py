@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+""" Stress test and benchmark: User reads and writes from 1, 4 and 16
+threads, checking the store is consistent afterwards, then concurrent
+updates and snapshots, checking no update is lost or torn
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import models.base as base
+from models.user import User
+
+USERS = 2000
+OPS = int(sys.argv[1]) if len(sys.argv) > 1 else 40000
+WRITERS = 8
+
+# journal appends keep the writes cheap enough for the locks to matter
+base.STORAGE_MODE = 'journal'
+os.chdir(tempfile.mkdtemp())
+User.load_from_file()
+for i in range(USERS):
+    user = User(email="seed{}@hbtn.io".format(i))
+    user.save()
+
+
+def worker(n: int, ops: int, errors: list):
+    """ Run ops random operations: mostly reads, some creations,
+    updates and removals of the thread's own users
+    """
+    rand = random.Random(n)
+    ids = User.sorted_ids()[:]
+    own = []
+    try:
+        for i in range(ops):
+            op = rand.random()
+            if op < 0.6:
+                User.get(rand.choice(ids))
+            elif op < 0.8:
+                email = "seed{}@hbtn.io".format(rand.randrange(USERS))
+                assert len(User.search({'email': email})) == 1
+            elif op < 0.85:
+                assert len(User.all()) >= USERS
+            elif op < 0.95:
+                user = User(email="t{}-{}@hbtn.io".format(n, i))
+                user.save()
+                own.append(user)
+            elif own:
+                own.pop(rand.randrange(len(own))).remove()
+            else:
+                user = User.get(rand.choice(ids))
+                user.first_name = "t{}".format(n)
+                user.save()
+    except Exception as e:
+        errors.append(e)
+    return own
+
+
+def run(threads: int):
+    """ Split OPS between threads and report the throughput
+    """
+    errors = []
+    kept = []
+    workers = [threading.Thread(
+        target=lambda n=n: kept.extend(worker(n, OPS // threads, errors)))
+        for n in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    assert not errors, errors
+    assert User.count() == USERS + len(kept)
+    for user in kept:
+        user.remove()
+    print("{:>2} threads  {:9.0f} ops/s".format(threads, OPS / elapsed))
+
+
+for threads in (1, 4, 16):
+    run(threads)
+
+expected = {user.id: user.to_json(True) for user in User.all()}
+User.load_from_file()
+assert {user.id: user.to_json(True) for user in User.all()} == expected
+print("store consistent: {} users".format(User.count()))
+
+
+def writer(n: int, ids: list, rounds: int, errors: list):
+    """ Replace the users of ids rounds times with copies whose
+    first_name and last_name are both '<n>-<round>', reading each one
+    back: a write can't be missing or half applied
+    """
+    try:
+        for i in range(rounds):
+            for obj_id in ids:
+                name = "{}-{}".format(n, i)
+                user = User(id=obj_id, email=User.get(obj_id).email,
+                            first_name=name, last_name=name)
+                user.save()
+                user = User.get(obj_id)
+                assert (user.first_name, user.last_name) == (name, name)
+    except Exception as e:
+        errors.append(e)
+
+
+def reader(ids: list, stop: threading.Event, errors: list):
+    """ Check the users of ids are never seen half updated
+    """
+    try:
+        while not stop.is_set():
+            for obj_id in ids:
+                user = User.get(obj_id)
+                assert user.first_name == user.last_name, user.to_json()
+    except Exception as e:
+        errors.append(e)
+
+
+def snapshots(stop: threading.Event, errors: list):
+    """ Write snapshots while the writers run, every 10 ms
+    """
+    try:
+        while not stop.wait(0.01):
+            if base.STORAGE_MODE == 'journal':
+                User.compact()
+            else:
+                User.save_to_file()
+    except Exception as e:
+        errors.append(e)
+
+
+def stress(mode: str, rounds: int):
+    """ WRITERS threads updating their own users while snapshots are
+    written, then check the last update of each user survives a reload
+    """
+    base.STORAGE_MODE = mode
+    ids = User.sorted_ids()[:]
+    owned = [ids[n::WRITERS][:10] for n in range(WRITERS)]
+    for obj_id in sum(owned, []):
+        user = User.get(obj_id)
+        user.first_name = user.last_name = None
+        user.save()
+    errors = []
+    stop = threading.Event()
+    writers = [threading.Thread(target=writer,
+                                args=(n, owned[n], rounds, errors))
+               for n in range(WRITERS)]
+    others = [threading.Thread(target=reader,
+                               args=(sum(owned, []), stop, errors)),
+              threading.Thread(target=snapshots, args=(stop, errors))]
+    start = time.perf_counter()
+    for t in writers + others:
+        t.start()
+    for t in writers:
+        t.join()
+    stop.set()
+    for t in others:
+        t.join()
+    elapsed = time.perf_counter() - start
+    assert not errors, errors
+    User.load_from_file()
+    for n in range(WRITERS):
+        name = "{}-{}".format(n, rounds - 1)
+        for obj_id in owned[n]:
+            user = User.get(obj_id)
+            assert (user.first_name, user.last_name) == (name, name)
+    print("{:<7} {} updates with snapshots: none lost or torn "
+          "({:.1f} s)".format(mode, WRITERS * 10 * rounds, elapsed))
+
+
+stress('journal', 10)
+stress('file', 2)
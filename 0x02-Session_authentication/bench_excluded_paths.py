@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+""" Benchmark: Auth.require_auth over a few hundred excluded paths,
+against matching them one regex at a time
+"""
+import re
+import sys
+import timeit
+
+from api.v1.auth.auth import Auth
+
+PATTERNS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+CALLS = 2000
+
+excluded_paths = []
+for i in range(PATTERNS):
+    excluded_paths.append(("/api/v1/resource{}/".format(i),
+                           "/api/v1/resource{}".format(i),
+                           "/api/v1/static{}/*".format(i))[i % 3])
+excluded_paths = tuple(excluded_paths)
+paths = ["/api/v1/users/me",
+         "/api/v1/resource{}/".format(PATTERNS - 3),
+         "/api/v1/static{}/app.js".format(PATTERNS - 1)]
+
+
+def one_by_one(path: str, excluded_paths: tuple) -> bool:
+    """ require_auth matching each excluded path on its own
+    """
+    for exclusion_path in map(lambda x: x.strip(), excluded_paths):
+        if exclusion_path[-1] == '*':
+            pattern = '{}.*'.format(exclusion_path[0:-1])
+        elif exclusion_path[-1] == '/':
+            pattern = '{}/*'.format(exclusion_path[0:-1])
+        else:
+            pattern = '{}/*'.format(exclusion_path)
+        if re.match(pattern, path):
+            return False
+    return True
+
+
+auth = Auth()
+for path in paths:
+    assert auth.require_auth(path, excluded_paths) == \
+        one_by_one(path, excluded_paths)
+    before = timeit.timeit(lambda: one_by_one(path, excluded_paths),
+                           number=CALLS) / CALLS
+    after = timeit.timeit(lambda: auth.require_auth(path, excluded_paths),
+                          number=CALLS) / CALLS
+    print("{:<28} one by one {:8.1f} us  compiled {:6.2f} us".format(
+        path, before * 1e6, after * 1e6))
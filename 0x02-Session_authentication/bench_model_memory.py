@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+""" Benchmark: bytes per User with slots, against the same attributes
+kept in a per-instance __dict__ (the layout before slots)
+"""
+import sys
+import tracemalloc
+
+from models.user import User
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+
+class DictUser():
+    """ The attributes of a User, kept in __dict__
+    """
+
+    def __init__(self, *args: list, **kwargs: dict):
+        """ Copy the attributes of a new User
+        """
+        user = User(*args, **kwargs)
+        for key in User.slot_attributes():
+            setattr(self, key, getattr(user, key))
+
+    def to_json(self) -> dict:
+        """ Attributes of the object
+        """
+        return self.__dict__
+
+
+def bytes_per_user(cls: type) -> float:
+    """ Memory allocated per object for USERS objects of cls
+    """
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    users = [cls(email="user{}@hbtn.io".format(i), first_name="Bob",
+                 last_name="Dylan", _password="{:064x}".format(i))
+             for i in range(USERS)]
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    assert users[-1].to_json()['email'] == "user{}@hbtn.io".format(USERS - 1)
+    return used / USERS
+
+
+before = bytes_per_user(DictUser)
+after = bytes_per_user(User)
+print("__dict__ {:7.1f} bytes/user".format(before))
+print("slots    {:7.1f} bytes/user  ({:.1%} less)".format(
+    after, 1 - after / before))
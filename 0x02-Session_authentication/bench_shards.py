@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+""" Benchmark: save() latency in file mode and load_from_file() time of
+N users stored in 1, 4 and 16 shards
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from models.user import User
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+SAVES = 200
+
+os.chdir(tempfile.mkdtemp())
+User.load_from_file()
+User.bulk_save([User(email="seed{}@hbtn.io".format(i))
+                for i in range(USERS)])
+users = User.all()
+
+for shards in (1, 4, 16):
+    User.reshard(shards)
+    start = time.perf_counter()
+    User.load_from_file()
+    load = time.perf_counter() - start
+    latencies = []
+    for user in users[:SAVES]:
+        user = User.get(user.id)
+        start = time.perf_counter()
+        user.save()
+        latencies.append(time.perf_counter() - start)
+    print("{:>2} shards  save {:7.2f} ms  load {:7.1f} ms".format(
+        shards, statistics.median(latencies) * 1000, load * 1000))
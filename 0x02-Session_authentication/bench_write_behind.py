@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+""" Benchmark: POST /api/v1/users latency with and without write-behind
+"""
+import os
+import statistics
+import tempfile
+import time
+from flask import Flask
+
+import models.base as base
+from models.user import User
+from api.v1.views import app_views
+
+USERS = 5000
+REQUESTS = 200
+
+os.chdir(tempfile.mkdtemp())
+User.load_from_file()
+
+app = Flask(__name__)
+app.register_blueprint(app_views)
+client = app.test_client()
+
+for i in range(USERS):
+    user = User(email="seed{}@hbtn.io".format(i))
+    base.DATA['User'][user.id] = user
+User.save_to_file()
+
+
+def run(label: str, write_behind: bool):
+    """ Times REQUESTS user creations through the view
+    """
+    base.WRITE_BEHIND = write_behind
+    latencies = []
+    for i in range(REQUESTS):
+        body = {"email": "{}{}@hbtn.io".format(label, i), "password": "pwd"}
+        start = time.perf_counter()
+        res = client.post("/api/v1/users", json=body)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert res.status_code == 201
+    base.Base.flush()
+    latencies.sort()
+    print("{:<14} mean {:7.3f} ms  p99 {:7.3f} ms".format(
+        label, statistics.mean(latencies),
+        latencies[int(len(latencies) * 0.99) - 1]))
+
+
+run("synchronous", False)
+run("write-behind", True)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+""" Regression check: load_from_file() with write-behind changes
+pending writes them first instead of dropping them
+"""
+import json
+import os
+import tempfile
+
+import models.base as base
+from models.user import User
+
+base.WRITE_BEHIND = True
+base.WRITE_BEHIND_INTERVAL = 3600
+base.WRITE_BEHIND_MAX_DIRTY = 10 ** 6
+
+os.chdir(tempfile.mkdtemp())
+User.load_from_file()
+for i in range(5):
+    User(email="wb{}@hbtn.io".format(i)).save()
+User.load_from_file()
+assert User.count() == 5, User.count()
+base.Base.flush()
+for file_path in base._sharded_files('User') + \
+        base._unsharded_files('User'):
+    if file_path.endswith('.json'):
+        assert json.load(open(file_path)) != {}, file_path
+User.load_from_file()
+assert User.count() == 5, User.count()
+print("write-behind reload ok")
@@ -1,39 +1,126 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from typing import TypeVar, List, Iterable, Iterator, Optional, Tuple
+from os import getenv, path
+import atexit
+import glob
 import json
+import os
+import tempfile
+import threading
+import time
 import uuid
+import zlib
 
+from models.codec import (CODECS, TIMESTAMP_FORMAT, convert, detect, dumps,
+                          fsync_dir, parse_timestamp, read_snapshot,
+                          write_file, write_snapshot)
+from models.index import Index, SortedIndex
+from models.lazy_store import LazyStore
+from models.rwlock import FileLock, RWLock
+from models.query import parse_filters
 
-TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# 'json' keeps the objects in DATA and persists them to files (see
+# models.file_storage), 'sqlite' stores them in the SQLITE_PATH database
+STORAGE_BACKEND = getenv('STORAGE_BACKEND', 'json')
+SQLITE_PATH = getenv('SQLITE_PATH', '.db.sqlite3')
 DATA = {}
+INDEXES = {}
+SORTED_INDEXES = {}
+SORTED_IDS = {}
+# per class: a reader-writer lock over DATA, the indexes and SORTED_IDS,
+# and per file lock path a lock serializing the writes of the files
+# behind it, across processes too
+LOCKS = {}
+FILE_LOCKS = {}
+# the files of a class can be split in shards, .db_<Class>.<shard>.json
+# (.bin) and so on, each object going to the shard picked by a hash of its id:
+# a change only rewrites or appends to the files of its shard, under the
+# lock of that shard. Each class records its number of shards in
+# .db_<Class>.shards (unsharded files have none); a class without files
+# starts with SHARDS. SHARD_COUNTS caches the numbers and SHARD_IDS the
+# ids of each shard. reshard() moves the files of a class to another
+# number of shards
+SHARDS = int(getenv('SHARDS', 1))
+SHARD_COUNTS = {}
+SHARD_IDS = {}
+# several processes can share the files: each one checks them for the
+# changes of the others at most every REFRESH_INTERVAL seconds, and
+# remembers in FILE_STATES, per (class, shard), the snapshot and
+# journal offset it has read
+REFRESH_INTERVAL = float(getenv('REFRESH_INTERVAL', 1.0))
+FILE_STATES = {}
+# 'file' rewrites the snapshot on every change, 'journal' appends
+# the change to .db_<Class>.journal and folds it into the snapshot
+# once JOURNAL_COMPACT_THRESHOLD records have piled up in it. Either way
+# the files are fsynced once written, so a crash loses no written change
+STORAGE_MODE = getenv('STORAGE_MODE', 'file')
+JOURNAL_COMPACT_THRESHOLD = int(getenv('JOURNAL_COMPACT_THRESHOLD', 1000))
+JOURNAL_SIZES = {}
+# format snapshots are written in, 'json' or 'binary' (see models.codec),
+# to .db_<Class>.json or .db_<Class>.bin; reading takes the newest file,
+# whatever the format, and writing removes the other one
+SNAPSHOT_FORMAT = getenv('SNAPSHOT_FORMAT', 'json')
+SNAPSHOT_EXTENSIONS = tuple(codec.extension for codec in CODECS.values())
+# with LAZY_STORE=1 a binary snapshot is memory-mapped by a LazyStore
+# instead of being loaded whole; LAZY_CACHE_SIZE objects stay cached.
+# Sharded files are always loaded whole
+LAZY_STORE = getenv('LAZY_STORE', '0') == '1'
+LAZY_CACHE_SIZE = int(getenv('LAZY_CACHE_SIZE', 10000))
+# write-behind: changes are held in DIRTY and written by a background
+# thread every WRITE_BEHIND_INTERVAL seconds, or as soon as
+# WRITE_BEHIND_MAX_DIRTY changes are pending
+WRITE_BEHIND = getenv('WRITE_BEHIND', '0') == '1'
+WRITE_BEHIND_INTERVAL = float(getenv('WRITE_BEHIND_INTERVAL', 1.0))
+WRITE_BEHIND_MAX_DIRTY = int(getenv('WRITE_BEHIND_MAX_DIRTY', 100))
+DIRTY = {}
+_dirty_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_wake = threading.Event()
+_flusher = None
+_UNSET = object()
+_setattr = object.__setattr__
 
 
 class Base():
     """ Base class
+    Subclasses list the attributes to keep a hash index on in
+    indexed_attributes; search() then resolves equality on them
+    without scanning. query() uses the sorted indexes kept on
+    sorted_attributes for ranges, prefixes and ordering
     """
+    indexed_attributes = ()
+    sorted_attributes = ('created_at', 'updated_at')
+    # attributes live in slots rather than a per-instance __dict__;
+    # subclasses declare their own, or get a __dict__ if they don't
+    __slots__ = ('id', 'created_at', 'updated_at', '_json_cache')
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+            DATA.setdefault(s_class, {})
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
-        if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
-        else:
-            self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+        # a new object has nothing cached yet: skip __setattr__
+        if 'id' in kwargs:
+            _setattr(self, 'id', kwargs['id'])
         else:
-            self.updated_at = datetime.utcnow()
+            _setattr(self, 'id', str(uuid.uuid4()))
+        for key in ('created_at', 'updated_at'):
+            value = kwargs.get(key)
+            if value is None:
+                value = datetime.utcnow()
+            elif type(value) is not datetime:
+                value = parse_timestamp(value)
+            _setattr(self, key, value)
+        _setattr(self, '_json_cache', None)
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -44,69 +131,579 @@ class Base():
             return False
         return (self.id == other.id)
 
+    def __setattr__(self, name: str, value):
+        """ Set an attribute, dropping the cached to_json() output
+        """
+        _setattr(self, name, value)
+        _setattr(self, '_json_cache', None)
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
+        The public form is cached until an attribute is set again
+        """
+        if for_serialization:
+            return self.serialize(True)
+        cache = getattr(self, '_json_cache', None)
+        if cache is None:
+            cache = [self.serialize(False), None]
+            object.__setattr__(self, '_json_cache', cache)
+        return dict(cache[0])
+
+    def to_json_bytes(self) -> bytes:
+        """ to_json() encoded as compact JSON with sorted keys,
+        cached like to_json()
+        """
+        cache = getattr(self, '_json_cache', None)
+        if cache is None:
+            self.to_json()
+            cache = self._json_cache
+        if cache[1] is None:
+            cache[1] = json.dumps(cache[0], sort_keys=True,
+                                  separators=(',', ':')).encode()
+        return cache[1]
+
+    def serialize(self, for_serialization: bool = False) -> dict:
+        """ Build the JSON dictionary of the object, without the
+        private attributes unless for_serialization
         """
+        keys = self.__class__.slot_attributes()
+        extra = getattr(self, '__dict__', None)
+        if extra:
+            keys = keys + tuple(extra)
         result = {}
-        for key, value in self.__dict__.items():
+        for key in keys:
             if not for_serialization and key[0] == '_':
                 continue
+            value = getattr(self, key, _UNSET)
+            if value is _UNSET:
+                continue
             if type(value) is datetime:
                 result[key] = value.strftime(TIMESTAMP_FORMAT)
             else:
                 result[key] = value
         return result
 
+    @classmethod
+    def slot_attributes(cls) -> Tuple[str, ...]:
+        """ Names of the slots of cls, base classes first
+        """
+        names = cls.__dict__.get('_slot_attributes')
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__):
+                slots = klass.__dict__.get('__slots__', ())
+                if type(slots) is str:
+                    slots = (slots,)
+                for name in slots:
+                    if name not in ('__dict__', '__weakref__',
+                                    '_json_cache') \
+                            and name not in names:
+                        names.append(name)
+            names = tuple(names)
+            cls._slot_attributes = names
+        return names
+
+    @classmethod
+    def lock(cls) -> RWLock:
+        """ Reader-writer lock of the objects of the class
+        """
+        lock = LOCKS.get(cls.__name__)
+        if lock is None:
+            lock = LOCKS.setdefault(cls.__name__, RWLock())
+        return lock
+
+    @classmethod
+    def file_lock(cls, shard: int = 0) -> FileLock:
+        """ Lock of the files of a shard of the class, .db_<Class>.lock
+        (.db_<Class>.<shard>.lock when sharded)
+        Taken before lock() when both are needed
+        """
+        lock_path = _shard_path(cls.__name__, 'lock', shard)
+        lock = FILE_LOCKS.get(lock_path)
+        if lock is None:
+            lock = FILE_LOCKS.setdefault(lock_path, FileLock(lock_path))
+        return lock
+
+    @classmethod
+    @contextmanager
+    def file_locks(cls):
+        """ Hold the file locks of every shard, in shard order, for the
+        with block
+        """
+        with ExitStack() as stack:
+            for shard in range(_shard_count(cls.__name__)):
+                stack.enter_context(cls.file_lock(shard))
+            yield
+
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from the storage backend
+        """
+        storage.load(cls)
+
+    @classmethod
+    def indexes(cls) -> dict:
+        """ Indexes of the class by attribute, built from the loaded
+        objects on first use (under lock(), read or write)
+        """
+        s_class = cls.__name__
+        indexes = INDEXES.get(s_class)
+        if indexes is None:
+            indexes = {attribute: Index(attribute)
+                       for attribute in cls.indexed_attributes}
+            for attribute, index in indexes.items():
+                for obj_id, value in _attribute_values(DATA[s_class],
+                                                       attribute):
+                    index.add_value(obj_id, value)
+            INDEXES[s_class] = indexes
+        return indexes
+
+    @classmethod
+    def sorted_indexes(cls) -> dict:
+        """ Sorted indexes of the class by attribute, built from the
+        loaded objects on first use (under lock(), read or write)
+        """
+        s_class = cls.__name__
+        indexes = SORTED_INDEXES.get(s_class)
+        if indexes is None:
+            indexes = {attribute: SortedIndex(attribute)
+                       for attribute in cls.sorted_attributes}
+            for attribute, index in indexes.items():
+                for obj_id, value in _attribute_values(DATA[s_class],
+                                                       attribute):
+                    index.add_value(obj_id, value)
+            SORTED_INDEXES[s_class] = indexes
+        return indexes
+
+    @classmethod
+    def sorted_ids(cls) -> List[str]:
+        """ Ids of the class in ascending order, built on first use
+        and kept in order by save() and remove() (under lock(),
+        read or write)
+        """
+        s_class = cls.__name__
+        if SORTED_IDS.get(s_class) is None:
+            SORTED_IDS[s_class] = sorted(DATA[s_class])
+        return SORTED_IDS[s_class]
+
+    @classmethod
+    def read_files(cls):
+        """ Load all objects from file: the snapshot of each shard, read
+        in parallel, then the changes journaled since it was written
+        (under file_locks() and lock().write())
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
+        shards = _shard_count(s_class)
+        if _sharded_files(s_class) and _unsharded_files(s_class):
+            raise ValueError("files of {} are both sharded and unsharded: "
+                             "reshard them again".format(s_class))
+        # a replaced LazyStore is unmapped once no reader holds it
         DATA[s_class] = {}
-        if not path.exists(file_path):
+        INDEXES.pop(s_class, None)
+        SORTED_INDEXES.pop(s_class, None)
+        SORTED_IDS.pop(s_class, None)
+        SHARD_IDS.pop(s_class, None)
+        if shards == 1:
+            file_path = _snapshot_path(s_class)
+            snapshot = _file_state(file_path)
+            if snapshot is not None and LAZY_STORE:
+                with open(file_path, 'rb') as f:
+                    codec = detect(f)
+                if codec.name == 'binary':
+                    DATA[s_class] = LazyStore(cls, file_path,
+                                              LAZY_CACHE_SIZE)
+                    cls.read_journal(0, snapshot)
+                    return
+            loaded = [cls.load_snapshot(0)]
+        else:
+            with ThreadPoolExecutor() as pool:
+                loaded = list(pool.map(cls.load_snapshot, range(shards)))
+        for shard, (snapshot, objs) in enumerate(loaded):
+            _put(cls, objs)
+            cls.read_journal(shard, snapshot)
+
+    @classmethod
+    def read_shard(cls, shard: int):
+        """ Load the objects of one shard from its files again (under
+        file_lock(shard) and lock().write())
+        """
+        if _shard_count(cls.__name__) == 1:
+            cls.read_files()
+            return
+        _drop(cls, list(_shard_ids(cls.__name__)[shard]))
+        snapshot, objs = cls.load_snapshot(shard)
+        _put(cls, objs)
+        cls.read_journal(shard, snapshot)
+
+    @classmethod
+    def load_snapshot(cls, shard: int) -> Tuple[Optional[tuple], list]:
+        """ Objects of the snapshot of a shard, and the state of its
+        file (None if there is none)
+        Raise ValueError on an object hashed to another shard
+        """
+        s_class = cls.__name__
+        file_path = _snapshot_path(s_class, shard)
+        snapshot = _file_state(file_path)
+        if snapshot is None:
+            return None, []
+        objs = [cls(**obj_json) for obj_json in read_snapshot(file_path)]
+        if _shard_count(s_class) > 1:
+            for obj in objs:
+                _check_shard(s_class, obj.id, shard)
+        return snapshot, objs
+
+    @classmethod
+    def read_journal(cls, shard: int, snapshot: Optional[tuple]):
+        """ Apply the journal of a shard over its snapshot, read at the
+        given state, and start tracking its files (under file_lock(shard)
+        and lock().write())
+        """
+        s_class = cls.__name__
+        JOURNAL_SIZES[(s_class, shard)], offset = cls.replay_journal(shard)
+        FILE_STATES[(s_class, shard)] = {
+            'snapshot': snapshot,
+            'offset': offset,
+            'checked': time.monotonic(),
+        }
+
+    @classmethod
+    def refresh(cls, force: bool = False, shard: int = None) -> bool:
+        """ Apply the changes other processes wrote to the files of
+        shard, or of every shard, since they were last read, at most
+        once per REFRESH_INTERVAL unless force
+        A new snapshot of a shard is loaded in full; otherwise only the
+        records appended to its journal since are applied
+        Return True if anything changed
+        """
+        s_class = cls.__name__
+        shards = range(_shard_count(s_class)) if shard is None \
+            else (shard,)
+        changed = False
+        for shard in shards:
+            state = FILE_STATES.get((s_class, shard))
+            if state is None:
+                continue
+            if not force and \
+                    time.monotonic() - state['checked'] < REFRESH_INTERVAL:
+                continue
+            file_path = _snapshot_path(s_class, shard)
+            journal_path = _shard_path(s_class, 'journal', shard)
+            state['checked'] = time.monotonic()
+            if _file_state(file_path) == state['snapshot'] and \
+                    _file_size(journal_path) == state['offset']:
+                continue
+            with cls.file_lock(shard), cls.lock().write():
+                if _file_state(file_path) != state['snapshot'] or \
+                        _file_size(journal_path) < state['offset']:
+                    cls.read_shard(shard)
+                    _put_dirty(cls, shard)
+                    changed = True
+                    continue
+                count, offset = cls.replay_journal(shard, state['offset'])
+                if count:
+                    _put_dirty(cls, shard)
+                JOURNAL_SIZES[(s_class, shard)] = \
+                    JOURNAL_SIZES.get((s_class, shard), 0) + count
+                changed = changed or offset != state['offset']
+                state['offset'] = offset
+        return changed
+
+    @classmethod
+    def replay_journal(cls, shard: int = 0,
+                       offset: int = 0) -> Tuple[int, int]:
+        """ Apply the changes journaled in a shard from offset to the
+        loaded objects (under file_lock(shard) and lock().write())
+        Return the number of records applied and the offset of the
+        end of the last one
+        """
+        s_class = cls.__name__
+        journal_path = _shard_path(s_class, 'journal', shard)
+        if not path.exists(journal_path):
+            return 0, 0
+        count = 0
+        with open(journal_path, 'rb+') as f:
+            f.seek(offset)
+            for line in iter(f.readline, b''):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn last write of a crashed process: cut it off
+                    # so the next append starts on a fresh line
+                    f.truncate(f.tell() - len(line))
+                    break
+                if _shard_count(s_class) > 1:
+                    _check_shard(s_class, record['id'], shard)
+                if record['op'] == 'save':
+                    _put(cls, [cls(**record['obj'])])
+                else:
+                    _drop(cls, [record['id']])
+                count += 1
+            return count, f.tell()
+
+    @classmethod
+    def save_to_file(cls, shard: int = None):
+        """ Save the objects of shard, or of every shard, to file, in
+        SNAPSHOT_FORMAT
+        The snapshot is encoded under lock().read() but written
+        aside, fsynced and renamed over the old one after it, so writers
+        don't wait on the disk and a crash never leaves a partial file
+        """
+        s_class = cls.__name__
+        shards = range(_shard_count(s_class)) if shard is None \
+            else (shard,)
+        for shard in shards:
+            file_path = _shard_path(s_class,
+                                    CODECS[SNAPSHOT_FORMAT].extension, shard)
+            with cls.file_lock(shard):
+                with cls.lock().read():
+                    data = DATA[s_class]
+                    if _shard_count(s_class) == 1:
+                        objs = data.values()
+                    else:
+                        objs = (data[obj_id]
+                                for obj_id in _shard_ids(s_class)[shard])
+                    content = dumps((obj.to_json(True) for obj in objs),
+                                    CODECS[SNAPSHOT_FORMAT])
+                write_file(file_path, content)
+                _remove_other_snapshots(s_class, shard, file_path)
+                if (s_class, shard) in FILE_STATES:
+                    FILE_STATES[(s_class, shard)]['snapshot'] = \
+                        _file_state(file_path)
+
+    @classmethod
+    def convert_file(cls, snapshot_format: str):
+        """ Rewrite the snapshot file of every shard in snapshot_format
+        """
+        s_class = cls.__name__
+        for shard in range(_shard_count(s_class)):
+            new_path = _shard_path(s_class,
+                                   CODECS[snapshot_format].extension, shard)
+            with cls.file_lock(shard):
+                file_path = _snapshot_path(s_class, shard)
+                if not path.exists(file_path):
+                    continue
+                convert(file_path, new_path, snapshot_format)
+                _remove_other_snapshots(s_class, shard, new_path)
+                file_path = new_path
+                if (s_class, shard) in FILE_STATES:
+                    FILE_STATES[(s_class, shard)]['snapshot'] = \
+                        _file_state(file_path)
+
+    @classmethod
+    def compact(cls, shard: int = None):
+        """ Fold the journal of shard, or of every shard, into a new
+        snapshot
+        Replaying a record twice is harmless, so a crash between the
+        snapshot rename and the journal truncation loses nothing
+        """
+        s_class = cls.__name__
+        shards = range(_shard_count(s_class)) if shard is None \
+            else (shard,)
+        for shard in shards:
+            with cls.file_lock(shard):
+                cls.refresh(force=True, shard=shard)
+                cls.save_to_file(shard)
+                open(_shard_path(s_class, 'journal', shard), 'w').close()
+                JOURNAL_SIZES[(s_class, shard)] = 0
+                if (s_class, shard) in FILE_STATES:
+                    FILE_STATES[(s_class, shard)]['offset'] = 0
+
+    @classmethod
+    def reshard(cls, shards: int):
+        """ Move the files of the class, in whatever number of shards
+        they are, to shards shards, and use that many from now on
+        Other classes keep theirs. No other process may use the files
+        meanwhile
+        """
+        s_class = cls.__name__
+        if s_class in DIRTY:
+            Base.flush()
+        old_files = _unsharded_files(s_class) + _sharded_files(s_class)
+        records = {}
+        # the newest last, should a crash have left two of a shard
+        for file_path in sorted(old_files,
+                                key=lambda p: os.stat(p).st_mtime_ns):
+            if file_path.rpartition('.')[2] in SNAPSHOT_EXTENSIONS:
+                for obj_json in read_snapshot(file_path):
+                    records[obj_json['id']] = obj_json
+        for file_path in sorted(old_files):
+            if not file_path.endswith('.journal'):
+                continue
+            with open(file_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record['op'] == 'save':
+                        records[record['id']] = record['obj']
+                    else:
+                        records.pop(record['id'], None)
+        with cls.lock().write():
+            SHARD_COUNTS[s_class] = shards
+            new_files = []
+            for shard in range(shards):
+                file_path = _shard_path(
+                    s_class, CODECS[SNAPSHOT_FORMAT].extension, shard)
+                write_snapshot(file_path,
+                               (obj_json for obj_id, obj_json
+                                in records.items()
+                                if _shard_of(s_class, obj_id) == shard),
+                               CODECS[SNAPSHOT_FORMAT])
+                new_files.append(file_path)
+            _write_shard_count(s_class, shards)
+            for file_path in old_files:
+                if file_path not in new_files:
+                    os.remove(file_path)
+            for key in [key for key in FILE_STATES if key[0] == s_class]:
+                del FILE_STATES[key]
+                JOURNAL_SIZES.pop(key, None)
+        with cls.file_locks(), cls.lock().write():
+            cls.read_files()
+
+    @classmethod
+    def persist(cls, op: str, obj: TypeVar('Base')):
+        """ Persist one change ('save' or 'remove' of obj), right away
+        or through write-behind
+        """
+        cls.persist_changes([(op, obj)])
+
+    @classmethod
+    def persist_changes(cls, changes: List[Tuple[str, TypeVar('Base')]]):
+        """ Persist changes, in one write or through write-behind
+        """
+        if not WRITE_BEHIND:
+            cls.write_changes(changes)
             return
+        global _flusher
+        with _dirty_lock:
+            pending_changes = DIRTY.setdefault(cls.__name__, (cls, {}))[1]
+            for op, obj in changes:
+                pending_changes[obj.id] = (op, obj)
+            pending = sum(len(changes) for _, changes in DIRTY.values())
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, daemon=True)
+                _flusher.start()
+                atexit.register(Base.flush)
+        if pending >= WRITE_BEHIND_MAX_DIRTY:
+            _flush_wake.set()
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def write_changes(cls, changes: List[Tuple[str, TypeVar('Base')]]):
+        """ Write changes according to STORAGE_MODE, to the files of
+        the shards of their objects only
+        """
+        for shard, shard_changes in _by_shard(cls.__name__,
+                                              changes).items():
+            cls.write_shard(shard, shard_changes)
 
     @classmethod
-    def save_to_file(cls):
-        """ Save all objects to file
+    def write_shard(cls, shard: int,
+                    changes: List[Tuple[str, TypeVar('Base')]]):
+        """ Write changes to objects of a shard to its files
+        The changes of other processes are read first, and the objects
+        of changes applied again over them
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        key = (s_class, shard)
+        with cls.file_lock(shard):
+            if cls.refresh(force=True, shard=shard):
+                with cls.lock().write():
+                    _put(cls, [obj for op, obj in changes if op == 'save'])
+                    _drop(cls, [obj.id for op, obj in changes
+                                if op == 'remove'])
+            if STORAGE_MODE != 'journal':
+                if JOURNAL_SIZES.get(key):
+                    cls.compact(shard)
+                else:
+                    cls.save_to_file(shard)
+                return
+            lines = []
+            for op, obj in changes:
+                record = {'op': op, 'id': obj.id}
+                if op == 'save':
+                    record['obj'] = obj.to_json(True)
+                lines.append(json.dumps(record) + "\n")
+            journal_path = _shard_path(s_class, 'journal', shard)
+            with open(journal_path, 'a') as f:
+                start = f.tell()
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+                end = f.tell()
+            if start == 0:
+                # the journal may have just been created
+                fsync_dir(journal_path)
+            state = FILE_STATES.get(key)
+            if state is not None and state['offset'] == start:
+                state['offset'] = end
+            JOURNAL_SIZES[key] = JOURNAL_SIZES.get(key, 0) + len(lines)
+            if JOURNAL_SIZES[key] >= JOURNAL_COMPACT_THRESHOLD:
+                cls.compact(shard)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @staticmethod
+    def flush():
+        """ Write every change held back by write-behind
+        Several changes to one object are written once, with the
+        object's latest state
+        The changes stay in DIRTY until written, so refresh() keeps
+        them visible meanwhile; a class that fails to write keeps them
+        there and the others are still written, the first error being
+        raised at the end
+        """
+        with _flush_lock:
+            with _dirty_lock:
+                dirty = [(cls, dict(changes))
+                         for cls, changes in DIRTY.values()]
+            error = None
+            for cls, changes in dirty:
+                try:
+                    cls.write_changes(list(changes.values()))
+                except Exception as e:
+                    error = error or e
+                    continue
+                with _dirty_lock:
+                    pending = DIRTY.get(cls.__name__, (cls, {}))[1]
+                    for obj_id, change in changes.items():
+                        # unless changed again since
+                        if pending.get(obj_id) is change:
+                            del pending[obj_id]
+                    if not pending:
+                        DIRTY.pop(cls.__name__, None)
+            if error is not None:
+                raise error
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        storage.save(self)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        storage.remove(self)
+
+    @classmethod
+    def bulk_save(cls, objs: List[TypeVar('Base')]):
+        """ Save objs with a single write of the storage
+        """
+        now = datetime.utcnow()
+        for obj in objs:
+            obj.updated_at = now
+        storage.bulk_save(objs)
+
+    @classmethod
+    def bulk_remove(cls, objs: List[TypeVar('Base')]):
+        """ Remove objs with a single write of the storage
+        """
+        storage.bulk_remove(objs)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return storage.count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -114,24 +711,294 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def iter_sorted(cls, cursor: str = None,
+                    limit: int = None) -> Iterator[TypeVar('Base')]:
+        """ Yield objects in ascending id order, starting after the
+        id cursor, at most limit of them
+        """
+        return storage.iter_sorted(cls, cursor, limit)
+
+    @classmethod
+    def next_cursor(cls, cursor: str = None,
+                    limit: int = None) -> Optional[str]:
+        """ Cursor of the page following the limit objects after
+        cursor, None if there are no more objects
+        """
+        if limit is None:
+            return None
+        return storage.next_cursor(cls, cursor, limit)
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return storage.get(cls, id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        return storage.search(cls, attributes)
+
+    @classmethod
+    def query(cls, filters: dict = {}, order_by: str = None,
+              limit: int = None, offset: int = 0) -> List[TypeVar('Base')]:
+        """ Objects matching every filter (see models.query), ordered
+        by the attribute order_by ('-attribute' for descending),
+        skipping offset of them and returning at most limit
+        """
+        return storage.query(cls, parse_filters(filters), order_by,
+                             limit, offset)
+
+
+def _put(cls: type, objs: List[TypeVar('Base')]):
+    """ Store objs in DATA and the indexes of cls (under lock().write())
+    """
+    s_class = cls.__name__
+    indexes = list(INDEXES.get(s_class, {}).values()) + \
+        list(SORTED_INDEXES.get(s_class, {}).values())
+    ids = SORTED_IDS.get(s_class)
+    shard_ids = _shard_ids(s_class) if _shard_count(s_class) > 1 else None
+    data = DATA[s_class]
+    for obj in objs:
+        data[obj.id] = obj
+        if shard_ids is not None:
+            shard_ids[_shard_of(s_class, obj.id)][obj.id] = None
+        for index in indexes:
+            index.add(obj)
+        if ids is not None:
+            i = bisect_left(ids, obj.id)
+            if i == len(ids) or ids[i] != obj.id:
+                ids.insert(i, obj.id)
+
+
+def _drop(cls: type, obj_ids: List[str]) -> List[str]:
+    """ Remove obj_ids from DATA and the indexes of cls (under
+    lock().write())
+    Return the ids that were there
+    """
+    s_class = cls.__name__
+    indexes = list(INDEXES.get(s_class, {}).values()) + \
+        list(SORTED_INDEXES.get(s_class, {}).values())
+    ids = SORTED_IDS.get(s_class)
+    shard_ids = _shard_ids(s_class) if _shard_count(s_class) > 1 else None
+    removed = []
+    for obj_id in obj_ids:
+        if DATA[s_class].get(obj_id) is None:
+            continue
+        del DATA[s_class][obj_id]
+        if shard_ids is not None:
+            shard_ids[_shard_of(s_class, obj_id)].pop(obj_id, None)
+        for index in indexes:
+            index.discard(obj_id)
+        if ids is not None:
+            i = bisect_left(ids, obj_id)
+            if i < len(ids) and ids[i] == obj_id:
+                del ids[i]
+        removed.append(obj_id)
+    return removed
+
+
+def _attribute_values(objs, attribute: str) -> Iterator[tuple]:
+    """ (id, value of attribute) of every object of a DATA[<Class>]
+    A LazyStore reads them from its snapshot without decoding objects
+    """
+    if isinstance(objs, LazyStore):
+        return objs.attribute_values(attribute)
+    return ((obj.id, getattr(obj, attribute, None))
+            for obj in objs.values())
+
+
+def _put_dirty(cls: type, shard: int):
+    """ Apply again the changes to objects of a shard of cls that are
+    held by write-behind, undone by reading its files (under
+    lock().write())
+    """
+    with _dirty_lock:
+        changes = list(DIRTY.get(cls.__name__, (cls, {}))[1].values())
+    changes = [(op, obj) for op, obj in changes
+               if _shard_of(cls.__name__, obj.id) == shard]
+    _put(cls, [obj for op, obj in changes if op == 'save'])
+    _drop(cls, [obj.id for op, obj in changes if op == 'remove'])
+
+
+def _shard_count(s_class: str) -> int:
+    """ Number of shards of the files of s_class: the one recorded in
+    .db_<Class>.shards, 1 for unsharded files, else SHARDS, recorded
+    right away
+    """
+    count = SHARD_COUNTS.get(s_class)
+    if count is None:
+        try:
+            with open(".db_{}.shards".format(s_class)) as f:
+                count = int(f.read())
+        except FileNotFoundError:
+            count = 1 if _unsharded_files(s_class) else SHARDS
+            if count > 1 and not _sharded_files(s_class):
+                _write_shard_count(s_class, count)
+        count = SHARD_COUNTS.setdefault(s_class, count)
+    return count
+
+
+def _write_shard_count(s_class: str, count: int):
+    """ Record the number of shards of s_class, none for 1
+    """
+    count_path = ".db_{}.shards".format(s_class)
+    if count == 1:
+        if path.exists(count_path):
+            os.remove(count_path)
+        return
+    # processes starting a new store at once may all record it
+    fd, tmp_path = tempfile.mkstemp(prefix=count_path + ".", suffix=".tmp",
+                                    dir=".")
+    with os.fdopen(fd, 'w') as f:
+        f.write(str(count))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, count_path)
+    fsync_dir(count_path)
+
+
+def _shard_of(s_class: str, obj_id: str) -> int:
+    """ Shard of the object of s_class with obj_id
+    crc32 rather than hash(), which differs between processes
+    """
+    shards = _shard_count(s_class)
+    if shards == 1:
+        return 0
+    return zlib.crc32(obj_id.encode()) % shards
+
+
+def _shard_ids(s_class: str) -> List[dict]:
+    """ Ids of the objects of s_class in each shard, as dict keys
+    """
+    shard_ids = SHARD_IDS.get(s_class)
+    if shard_ids is None:
+        shard_ids = SHARD_IDS.setdefault(
+            s_class, [{} for shard in range(_shard_count(s_class))])
+    return shard_ids
+
+
+def _check_shard(s_class: str, obj_id: str, shard: int):
+    """ Raise ValueError if obj_id doesn't belong in shard
+    """
+    if _shard_of(s_class, obj_id) != shard:
+        raise ValueError("{} {} found in shard {}: files of {} are not "
+                         "in {} shards, reshard them first".format(
+                             s_class, obj_id, shard, s_class,
+                             _shard_count(s_class)))
+
+
+def _shard_path(s_class: str, kind: str, shard: int = 0) -> str:
+    """ Path of the kind (a SNAPSHOT_EXTENSIONS one, 'journal' or 'lock')
+    file of a shard of s_class
+    """
+    if _shard_count(s_class) == 1:
+        return ".db_{}.{}".format(s_class, kind)
+    return ".db_{}.{}.{}".format(s_class, shard, kind)
+
+
+def _snapshot_path(s_class: str, shard: int = 0) -> str:
+    """ Path of the snapshot of a shard of s_class: the newest of its
+    files in any format, else where SNAPSHOT_FORMAT writes it
+    """
+    newest = None
+    for extension in SNAPSHOT_EXTENSIONS:
+        file_path = _shard_path(s_class, extension, shard)
+        try:
+            mtime = os.stat(file_path).st_mtime_ns
+        except FileNotFoundError:
+            continue
+        if newest is None or mtime > newest[0]:
+            newest = (mtime, file_path)
+    if newest is None:
+        return _shard_path(s_class, CODECS[SNAPSHOT_FORMAT].extension, shard)
+    return newest[1]
+
+
+def _remove_other_snapshots(s_class: str, shard: int, file_path: str):
+    """ Remove the snapshots of a shard of s_class in other formats than
+    the one just written to file_path
+    """
+    removed = False
+    for extension in SNAPSHOT_EXTENSIONS:
+        other_path = _shard_path(s_class, extension, shard)
+        if other_path != file_path and path.exists(other_path):
+            os.remove(other_path)
+            removed = True
+    if removed:
+        fsync_dir(file_path)
+
+
+def _unsharded_files(s_class: str) -> List[str]:
+    """ Snapshots and journal of s_class stored unsharded
+    """
+    return [file_path for file_path in
+            (".db_{}.{}".format(s_class, kind)
+             for kind in SNAPSHOT_EXTENSIONS + ('journal',))
+            if path.exists(file_path)]
+
+
+def _sharded_files(s_class: str) -> List[str]:
+    """ Snapshots and journals of the shards of s_class, whatever
+    their number
+    """
+    prefix = ".db_{}.".format(s_class)
+    return [file_path for file_path in glob.glob(glob.escape(prefix) + '*')
+            if file_path[len(prefix):].partition('.')[0].isdigit() and
+            file_path.rpartition('.')[2] in SNAPSHOT_EXTENSIONS +
+            ('journal',)]
+
+
+def _by_shard(s_class: str,
+              changes: List[Tuple[str, TypeVar('Base')]]) -> dict:
+    """ changes to objects of s_class grouped by the shard of their
+    object, in order
+    """
+    groups = {}
+    for change in changes:
+        groups.setdefault(_shard_of(s_class, change[1].id),
+                          []).append(change)
+    return groups
+
+
+def _file_state(file_path: str):
+    """ Identity of the current content of file_path: inode, mtime
+    and size, or None if it doesn't exist
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _file_size(file_path: str) -> int:
+    """ Size of file_path, 0 if it doesn't exist
+    """
+    try:
+        return os.stat(file_path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _flush_loop():
+    """ Body of the write-behind thread
+    """
+    while True:
+        _flush_wake.wait(WRITE_BEHIND_INTERVAL)
+        _flush_wake.clear()
+        try:
+            Base.flush()
+        except Exception:
+            # the changes stay in DIRTY for the next round
+            pass
+
+
+if STORAGE_BACKEND == 'sqlite':
+    from models.sqlite_storage import SQLiteStorage
+    storage = SQLiteStorage(SQLITE_PATH)
+else:
+    from models.file_storage import FileStorage
+    storage = FileStorage()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+""" Codec module: snapshot file formats of the Base store
+"""
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterable, Iterator
+import io
+import json
+import os
+import struct
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+EPOCH = datetime(1970, 1, 1)
+ONE_SECOND = timedelta(seconds=1)
+NO_TIMESTAMP = -2 ** 63
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+    fromisoformat is a C fast path for the zero padded form every
+    snapshot holds; anything else goes through strptime
+    """
+    if len(value) == 19 and value[10] == 'T':
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def to_epoch(value) -> int:
+    """ Seconds since EPOCH of a datetime or TIMESTAMP_FORMAT string
+    """
+    if value is None:
+        return NO_TIMESTAMP
+    if type(value) is not datetime:
+        value = parse_timestamp(value)
+    return (value - EPOCH) // ONE_SECOND
+
+
+def from_epoch(value: int) -> datetime:
+    """ Naive UTC datetime of seconds since EPOCH
+    """
+    if value == NO_TIMESTAMP:
+        return None
+    return datetime.utcfromtimestamp(value)
+
+
+class JSONCodec():
+    """ One JSON object mapping ids to attributes (the original format)
+    """
+    name = 'json'
+    extension = 'json'
+
+    def dump(self, records: Iterable[dict], f: BinaryIO):
+        """ Write records to f
+        """
+        objs_json = {}
+        for record in records:
+            objs_json[record['id']] = record
+        f.write(json.dumps(objs_json, default=self._default).encode())
+
+    @staticmethod
+    def _default(value):
+        """ Serialize the datetimes json can't
+        """
+        if type(value) is datetime:
+            return value.strftime(TIMESTAMP_FORMAT)
+        raise TypeError("{} is not JSON serializable".format(type(value)))
+
+    def load(self, f: BinaryIO) -> Iterator[dict]:
+        """ Yield the records of f, timestamps as strings
+        """
+        content = f.read()
+        if not content:
+            return
+        yield from json.loads(content).values()
+
+
+class BinaryCodec():
+    """ Length-prefixed records after a MAGIC header
+    Each record is: body length, created_at and updated_at as epoch
+    seconds, id length, id, then the other attributes as compact JSON
+    """
+    name = 'binary'
+    extension = 'bin'
+    MAGIC = b'BDB\x01'
+    HEADER = struct.Struct('<IqqH')
+
+    def dump(self, records: Iterable[dict], f: BinaryIO):
+        """ Write records to f
+        """
+        pack = self.HEADER.pack
+        id_offset = self.HEADER.size - 4
+        encode = json.JSONEncoder(separators=(',', ':'),
+                                  default=JSONCodec._default).encode
+        parts = [self.MAGIC]
+        for record in records:
+            rest = dict(record)
+            obj_id = rest.pop('id').encode()
+            created = to_epoch(rest.pop('created_at', None))
+            updated = to_epoch(rest.pop('updated_at', None))
+            blob = encode(rest).encode()
+            parts.append(pack(id_offset + len(obj_id) + len(blob),
+                              created, updated, len(obj_id)))
+            parts.append(obj_id)
+            parts.append(blob)
+        f.write(b''.join(parts))
+
+    def load(self, f: BinaryIO) -> Iterator[dict]:
+        """ Yield the records of f, timestamps as datetimes
+        The attribute blobs of all records are parsed by a single
+        json.loads call instead of one per record
+        """
+        data = f.read()
+        unpack_from = self.HEADER.unpack_from
+        header_size = self.HEADER.size
+        headers = []
+        blobs = []
+        for offset in self.offsets(data):
+            size, created, updated, id_size = unpack_from(data, offset)
+            start = offset + header_size
+            headers.append((data[start:start + id_size].decode(),
+                            created, updated))
+            blobs.append(data[start + id_size:offset + 4 + size])
+        attributes = json.loads(b'[' + b','.join(blobs) + b']')
+        for (obj_id, created, updated), rest in zip(headers, attributes):
+            record = {
+                'id': obj_id,
+                'created_at': from_epoch(created),
+                'updated_at': from_epoch(updated),
+            }
+            record.update(rest)
+            yield record
+
+    def offsets(self, data) -> Iterator[int]:
+        """ Yield the offset of every record in data
+        """
+        unpack_from = struct.Struct('<I').unpack_from
+        offset = len(self.MAGIC)
+        end = len(data)
+        while offset < end:
+            yield offset
+            offset += 4 + unpack_from(data, offset)[0]
+
+    def decode(self, data, offset: int) -> dict:
+        """ Decode the record at offset of data
+        """
+        size, created, updated, id_size = self.HEADER.unpack_from(
+            data, offset)
+        start = offset + self.HEADER.size
+        record = {
+            'id': data[start:start + id_size].decode(),
+            'created_at': from_epoch(created),
+            'updated_at': from_epoch(updated),
+        }
+        record.update(json.loads(data[start + id_size:offset + 4 + size]))
+        return record
+
+
+CODECS = {codec.name: codec for codec in (JSONCodec(), BinaryCodec())}
+
+
+def detect(f: BinaryIO):
+    """ Codec of the snapshot open in f, from its first bytes
+    """
+    magic = BinaryCodec.MAGIC
+    if f.peek(len(magic))[:len(magic)] == magic:
+        return CODECS['binary']
+    return CODECS['json']
+
+
+def dumps(records: Iterable[dict], codec) -> bytes:
+    """ Content of a snapshot of records in codec
+    """
+    f = io.BytesIO()
+    codec.dump(records, f)
+    return f.getvalue()
+
+
+def fsync_dir(file_path: str):
+    """ Make the creation, removal or renaming of file_path durable
+    """
+    fd = os.open(os.path.dirname(file_path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_file(file_path: str, content: bytes):
+    """ Write content to file_path
+    The file is written aside, fsynced and renamed over the old one,
+    and the rename fsynced, so a crash leaves either the old or the
+    new file behind, never a partial one
+    """
+    tmp_path = "{}.tmp".format(file_path)
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+    fsync_dir(file_path)
+
+
+def write_snapshot(file_path: str, records: Iterable[dict], codec):
+    """ Write records to file_path with codec (see write_file)
+    """
+    write_file(file_path, dumps(records, codec))
+
+
+def read_snapshot(file_path: str) -> Iterator[dict]:
+    """ Yield the records of file_path, whatever its format
+    """
+    with open(file_path, 'rb') as f:
+        yield from detect(f).load(f)
+
+
+def convert(file_path: str, new_path: str, codec_name: str):
+    """ Rewrite the snapshot at file_path to new_path in another format
+    """
+    records = list(read_snapshot(file_path))
+    write_snapshot(new_path, records, CODECS[codec_name])
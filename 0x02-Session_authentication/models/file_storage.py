@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+""" File storage backend module
+Imported by models.base once Base is defined
+"""
+from bisect import bisect_right
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, TypeVar
+
+from models.base import Base, DATA, DIRTY, SHARD_COUNTS, _drop, _put
+from models.index import SortedIndex
+from models.query import RANGE_OPERATORS, matches, parse_order_by, sort_key
+from models.storage import Storage
+
+
+class FileStorage(Storage):
+    """ JSON backend: the objects of each class live in DATA and are
+    persisted to .db_<Class>.json or .bin, or its shards, by the file
+    methods of Base
+    Reads first pick up the changes of other processes (see refresh)
+    """
+
+    def load(self, cls: type):
+        """ Load all objects from file: the snapshot, then the changes
+        journaled since it was written
+        """
+        if cls.__name__ in DIRTY:
+            Base.flush()
+        # the files may have been resharded since
+        SHARD_COUNTS.pop(cls.__name__, None)
+        with cls.file_locks(), cls.lock().write():
+            cls.read_files()
+
+    def save(self, obj: TypeVar('Base')):
+        """ Store obj in DATA and persist the change
+        """
+        self.bulk_save([obj])
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Remove obj from DATA and persist the change
+        """
+        self.bulk_remove([obj])
+
+    def bulk_save(self, objs: List[TypeVar('Base')]):
+        """ Store objs in DATA, then persist the changes of each class
+        at once
+        """
+        for cls, objs in _by_class(objs).items():
+            with cls.lock().write():
+                _put(cls, objs)
+            cls.persist_changes([('save', obj) for obj in objs])
+
+    def bulk_remove(self, objs: List[TypeVar('Base')]):
+        """ Remove objs from DATA, then persist the changes of each
+        class at once
+        """
+        for cls, objs in _by_class(objs).items():
+            with cls.lock().write():
+                removed = set(_drop(cls, [obj.id for obj in objs]))
+            if removed:
+                cls.persist_changes([('remove', obj) for obj in objs
+                                     if obj.id in removed])
+
+    def count(self, cls: type) -> int:
+        """ Count all objects
+        """
+        cls.refresh()
+        s_class = cls.__name__
+        with cls.lock().read():
+            return len(DATA[s_class].keys())
+
+    def iter_sorted(self, cls: type, cursor: Optional[str],
+                    limit: Optional[int]) -> Iterator[TypeVar('Base')]:
+        """ Yield objects in ascending id order
+        The ids to visit are fixed when iteration starts; objects
+        removed in the meantime are skipped
+        """
+        cls.refresh()
+        s_class = cls.__name__
+        with cls.lock().read():
+            ids = cls.sorted_ids()
+            start = 0 if cursor is None else bisect_right(ids, cursor)
+            end = len(ids) if limit is None else start + limit
+            ids = ids[start:end]
+            objs = DATA[s_class]
+        for obj_id in ids:
+            obj = objs.get(obj_id)
+            if obj is not None:
+                yield obj
+
+    def next_cursor(self, cls: type, cursor: Optional[str],
+                    limit: Optional[int]) -> Optional[str]:
+        """ Cursor of the page following the limit objects after cursor
+        """
+        cls.refresh()
+        with cls.lock().read():
+            ids = cls.sorted_ids()
+            end = limit if cursor is None else \
+                bisect_right(ids, cursor) + limit
+            if end >= len(ids):
+                return None
+            return ids[end - 1]
+
+    def get(self, cls: type, obj_id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        cls.refresh()
+        s_class = cls.__name__
+        with cls.lock().read():
+            return DATA[s_class].get(obj_id)
+
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes
+        Equality on an indexed attribute only checks the objects
+        indexed under that value at their last save()
+        The candidates are copied under the read lock and filtered
+        after it is released
+        """
+        cls.refresh()
+        s_class = cls.__name__
+        def _search(obj):
+            if len(attributes) == 0:
+                return True
+            for k, v in attributes.items():
+                if (getattr(obj, k) != v):
+                    return False
+            return True
+
+        with cls.lock().read():
+            objs = DATA[s_class]
+            candidates = None
+            indexes = cls.indexes()
+            for k, v in attributes.items():
+                ids = indexes[k].lookup(v) if k in indexes else None
+                if ids is not None:
+                    candidates = [objs[obj_id] for obj_id in ids]
+                    break
+            if candidates is None:
+                candidates = list(objs.values())
+        return list(filter(_search, candidates))
+
+    def query(self, cls: type, conditions: list, order_by: Optional[str],
+              limit: Optional[int], offset: int) -> List[TypeVar('Base')]:
+        """ Objects matching conditions, ordered, offset and limited
+        The candidates come from, by preference: a hash index on an
+        equality, the sorted index of order_by (narrowed by the
+        conditions on that attribute), or a sorted index on a range
+        condition; anything else scans. Unless the objects then have
+        to be sorted, iteration stops once limit objects are found
+        """
+        cls.refresh()
+        s_class = cls.__name__
+        attribute, reverse = parse_order_by(order_by) if order_by \
+            else (None, False)
+        with cls.lock().read():
+            objs = DATA[s_class]
+            ids, ordered = self._candidates(cls, conditions, attribute,
+                                            reverse)
+            candidates = objs.values() if ids is None \
+                else (objs[obj_id] for obj_id in ids)
+            found = (obj for obj in candidates
+                     if all(matches(condition,
+                                    getattr(obj, condition.attribute, None))
+                            for condition in conditions))
+            if attribute is not None and not ordered:
+                found = iter(sorted(found, key=sort_key(attribute),
+                                    reverse=reverse))
+            end = None if limit is None else offset + limit
+            return list(islice(found, offset, end))
+
+    def _candidates(self, cls: type, conditions: list,
+                    attribute: Optional[str], reverse: bool):
+        """ Ids to check for query(), None to scan every object, and
+        whether they come in the order of attribute
+        """
+        indexes = cls.indexes()
+        for condition in conditions:
+            if condition.op == 'eq' and condition.attribute in indexes:
+                ids = indexes[condition.attribute].lookup(condition.value)
+                if ids is not None:
+                    return list(ids), attribute is None
+        sorted_indexes = cls.sorted_indexes()
+        ranges = [condition for condition in conditions
+                  if condition.op in RANGE_OPERATORS
+                  and condition.attribute in sorted_indexes]
+        if attribute in sorted_indexes:
+            index = sorted_indexes[attribute]
+            for condition in ranges:
+                if condition.attribute == attribute:
+                    ids = self._range(index, condition, reverse)
+                    if ids is not None:
+                        return ids, True
+            return index.ordered(reverse), True
+        for condition in ranges:
+            ids = self._range(sorted_indexes[condition.attribute],
+                              condition, False)
+            if ids is not None:
+                return ids, attribute is None
+        return None, attribute is None
+
+    @staticmethod
+    def _range(index: SortedIndex, condition, reverse: bool):
+        """ Ids of index matching a range condition, None if its value
+        can't be compared to the indexed ones
+        """
+        op = condition.op
+        value = condition.value
+        if value is None:
+            return None
+        try:
+            if op == 'startswith':
+                return index.prefix(value, reverse)
+            if op == 'eq':
+                return index.scan(value, value, reverse=reverse)
+            if op in ('gt', 'gte'):
+                return index.scan(low=value, low_inclusive=op == 'gte',
+                                  reverse=reverse)
+            return index.scan(high=value, high_inclusive=op == 'lte',
+                              reverse=reverse)
+        except TypeError:
+            return None
+
+
+def _by_class(objs: Iterable[TypeVar('Base')]) -> dict:
+    """ objs grouped by class, in order
+    """
+    groups = {}
+    for obj in objs:
+        groups.setdefault(obj.__class__, []).append(obj)
+    return groups
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+""" Index module
+"""
+from bisect import bisect_left, insort
+from typing import Iterable, Iterator, Optional
+
+
+class Index():
+    """ Hash index of one attribute: maps a value to the ids of the
+    objects saved with that value
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty Index
+        """
+        self.attribute = attribute
+        self._ids = {}
+        self._values = {}
+
+    def add(self, obj) -> None:
+        """ Index obj under its current value, replacing any
+        previous entry for the same id
+        """
+        self.add_value(obj.id, getattr(obj, self.attribute, None))
+
+    def add_value(self, obj_id: str, value) -> None:
+        """ Index obj_id under value, replacing any previous entry
+        """
+        self.discard(obj_id)
+        try:
+            self._ids.setdefault(value, {})[obj_id] = None
+        except TypeError:
+            return
+        self._values[obj_id] = value
+
+    def discard(self, obj_id: str) -> None:
+        """ Remove the entry of obj_id, if any
+        """
+        if obj_id not in self._values:
+            return
+        value = self._values.pop(obj_id)
+        ids = self._ids[value]
+        del ids[obj_id]
+        if not ids:
+            del self._ids[value]
+
+    def lookup(self, value) -> Optional[Iterable[str]]:
+        """ Ids of the objects indexed under value,
+        None if value can't be looked up
+        """
+        try:
+            return self._ids.get(value, {}).keys()
+        except TypeError:
+            return None
+
+    def clear(self) -> None:
+        """ Remove every entry
+        """
+        self._ids = {}
+        self._values = {}
+
+
+class _Max():
+    """ Compares greater than anything: bounds the (value, id) keys
+    of a value from above
+    """
+
+    def __lt__(self, other) -> bool:
+        return False
+
+    def __gt__(self, other) -> bool:
+        return True
+
+
+_MAX = _Max()
+
+
+class SortedIndex():
+    """ Ordered index of one attribute: (value, id) keys kept sorted
+    with bisect, for range and prefix scans and ordered iteration
+    Objects whose value is None, or can't be ordered against the
+    other values, are kept apart and come last in full scans
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty SortedIndex
+        """
+        self.attribute = attribute
+        self._keys = []
+        self._values = {}
+        self._unordered = {}
+
+    def add(self, obj) -> None:
+        """ Index obj under its current value, replacing any
+        previous entry for the same id
+        """
+        self.add_value(obj.id, getattr(obj, self.attribute, None))
+
+    def add_value(self, obj_id: str, value) -> None:
+        """ Index obj_id under value, replacing any previous entry
+        """
+        self.discard(obj_id)
+        if value is not None:
+            try:
+                insort(self._keys, (value, obj_id))
+                self._values[obj_id] = value
+                return
+            except TypeError:
+                pass
+        self._unordered[obj_id] = None
+
+    def discard(self, obj_id: str) -> None:
+        """ Remove the entry of obj_id, if any
+        """
+        if obj_id in self._unordered:
+            del self._unordered[obj_id]
+            return
+        if obj_id not in self._values:
+            return
+        key = (self._values.pop(obj_id), obj_id)
+        del self._keys[bisect_left(self._keys, key)]
+
+    def scan(self, low=None, high=None, low_inclusive: bool = True,
+             high_inclusive: bool = True,
+             reverse: bool = False) -> Iterator[str]:
+        """ Ids of the values between low and high (None: unbounded),
+        in value then id order
+        """
+        keys = self._keys
+        start = 0
+        if low is not None:
+            start = bisect_left(keys, (low,) if low_inclusive
+                                else (low, _MAX))
+        end = len(keys)
+        if high is not None:
+            end = bisect_left(keys, (high, _MAX) if high_inclusive
+                              else (high,))
+        if reverse:
+            return (keys[i][1] for i in range(end - 1, start - 1, -1))
+        return (keys[i][1] for i in range(start, end))
+
+    def prefix(self, prefix: str, reverse: bool = False) -> Iterator[str]:
+        """ Ids of the string values starting with prefix, in order
+        """
+        keys = self._keys
+        start = bisect_left(keys, (prefix,))
+        end = start
+        while end < len(keys) and type(keys[end][0]) is str \
+                and keys[end][0].startswith(prefix):
+            end += 1
+        if reverse:
+            return (keys[i][1] for i in range(end - 1, start - 1, -1))
+        return (keys[i][1] for i in range(start, end))
+
+    def ordered(self, reverse: bool = False) -> Iterator[str]:
+        """ All ids in value order, the unordered ones last
+        (first when reverse)
+        """
+        if reverse:
+            yield from sorted(self._unordered, reverse=True)
+            yield from self.scan(reverse=True)
+        else:
+            yield from self.scan()
+            yield from sorted(self._unordered)
+
+    def clear(self) -> None:
+        """ Remove every entry
+        """
+        self._keys = []
+        self._values = {}
+        self._unordered = {}
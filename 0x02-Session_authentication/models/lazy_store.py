@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+""" Lazy store module
+"""
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Iterator
+import json
+import mmap
+import threading
+
+from models.codec import CODECS, from_epoch
+
+
+class LazyStore(MutableMapping):
+    """ Read-mostly stand-in for a DATA[<Class>] dict
+    Memory-maps a binary snapshot and only keeps an id -> offset
+    index; objects are built on access and the most recently used
+    ones are kept in a bounded LRU cache.
+    Objects written since the snapshot are held in full until the
+    store is reloaded.
+    Readers may share it: the LRU cache has its own lock.
+    """
+
+    def __init__(self, cls: type, file_path: str, cache_size: int = 10000):
+        """ Map file_path, a binary snapshot of cls objects
+        """
+        self.cls = cls
+        self.cache_size = cache_size
+        self._codec = CODECS['binary']
+        self._file = open(file_path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+        header_size = self._codec.HEADER.size
+        unpack_from = self._codec.HEADER.unpack_from
+        self._offsets = {}
+        for offset in self._codec.offsets(self._data):
+            id_size = unpack_from(self._data, offset)[3]
+            start = offset + header_size
+            obj_id = self._data[start:start + id_size].decode()
+            self._offsets[obj_id] = offset
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._changed = {}
+        self._removed = set()
+        self._added = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, obj_id: str):
+        """ Object of obj_id, decoded from the snapshot if not cached
+        """
+        obj = self._changed.get(obj_id)
+        if obj is not None:
+            return obj
+        if obj_id in self._removed:
+            raise KeyError(obj_id)
+        with self._cache_lock:
+            obj = self._cache.get(obj_id)
+            if obj is not None:
+                self.hits += 1
+                self._cache.move_to_end(obj_id)
+                return obj
+        offset = self._offsets[obj_id]
+        obj = self.cls(**self._codec.decode(self._data, offset))
+        with self._cache_lock:
+            self.misses += 1
+            obj = self._cache.setdefault(obj_id, obj)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return obj
+
+    def __setitem__(self, obj_id: str, obj):
+        """ Hold a written object until the next reload
+        """
+        if obj_id not in self._offsets and obj_id not in self._changed:
+            self._added += 1
+        self._removed.discard(obj_id)
+        self._cache.pop(obj_id, None)
+        self._changed[obj_id] = obj
+
+    def __delitem__(self, obj_id: str):
+        """ Forget obj_id
+        """
+        if obj_id not in self:
+            raise KeyError(obj_id)
+        self._cache.pop(obj_id, None)
+        if self._changed.pop(obj_id, None) is not None and \
+                obj_id not in self._offsets:
+            self._added -= 1
+        if obj_id in self._offsets:
+            self._removed.add(obj_id)
+
+    def __contains__(self, obj_id) -> bool:
+        """ Checks obj_id without decoding it
+        """
+        if obj_id in self._changed:
+            return True
+        return obj_id in self._offsets and obj_id not in self._removed
+
+    def __iter__(self) -> Iterator[str]:
+        """ Ids in snapshot order, then ids added since
+        """
+        for obj_id in list(self._offsets):
+            if obj_id not in self._removed:
+                yield obj_id
+        for obj_id in list(self._changed):
+            if obj_id not in self._offsets:
+                yield obj_id
+
+    def __len__(self) -> int:
+        """ Number of objects
+        """
+        return len(self._offsets) - len(self._removed) + self._added
+
+    def attribute_values(self, attribute: str) -> Iterator[tuple]:
+        """ (id, value of attribute) of every object, read from the raw
+        snapshot records without building or caching the objects
+        """
+        changed = self._changed
+        removed = self._removed
+        data = self._data
+        unpack_from = self._codec.HEADER.unpack_from
+        header_size = self._codec.HEADER.size
+        ids = [obj_id for obj_id in self._offsets
+               if obj_id not in removed and obj_id not in changed]
+        if attribute in ('created_at', 'updated_at'):
+            field = 1 if attribute == 'created_at' else 2
+            for obj_id in ids:
+                header = unpack_from(data, self._offsets[obj_id])
+                yield obj_id, from_epoch(header[field])
+        else:
+            blobs = []
+            for obj_id in ids:
+                offset = self._offsets[obj_id]
+                size, _, _, id_size = unpack_from(data, offset)
+                blobs.append(data[offset + header_size + id_size:
+                                  offset + 4 + size])
+            # one json.loads call for all the blobs, as BinaryCodec.load
+            rests = json.loads(b'[' + b','.join(blobs) + b']')
+            for obj_id, rest in zip(ids, rests):
+                yield obj_id, rest.get(attribute)
+        for obj_id, obj in list(changed.items()):
+            yield obj_id, getattr(obj, attribute, None)
+
+    def close(self):
+        """ Unmap the snapshot
+        """
+        self._data.close()
+        self._file.close()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+""" Query module: the filters of Base.query
+A filter maps '<attribute>' or '<attribute>__<operator>' to a value,
+e.g. {'email__startswith': 'bob', 'created_at__gte': datetime(2024, 1, 1)}
+"""
+from collections import namedtuple
+from typing import List, Tuple
+
+
+OPERATORS = ('eq', 'ne', 'lt', 'lte', 'gt', 'gte', 'startswith', 'in')
+# operators whose matches are a contiguous range of a sorted index
+RANGE_OPERATORS = ('eq', 'lt', 'lte', 'gt', 'gte', 'startswith')
+
+Condition = namedtuple('Condition', ['attribute', 'op', 'value'])
+
+
+def parse_filters(filters: dict) -> List[Condition]:
+    """ Conditions of filters
+    Raise ValueError on an unknown operator
+    """
+    conditions = []
+    for key, value in filters.items():
+        attribute, _, op = key.partition('__')
+        op = op or 'eq'
+        if op not in OPERATORS:
+            raise ValueError("unknown operator: {}".format(op))
+        if op == 'in':
+            value = tuple(value)
+        conditions.append(Condition(attribute, op, value))
+    return conditions
+
+
+def parse_order_by(order_by: str) -> Tuple[str, bool]:
+    """ Attribute and descending flag of order_by ('email', '-email')
+    """
+    if order_by[0] == '-':
+        return order_by[1:], True
+    return order_by, False
+
+
+def matches(condition: Condition, value) -> bool:
+    """ Whether the attribute value satisfies condition
+    Values that can't be compared to the condition never match
+    """
+    op = condition.op
+    expected = condition.value
+    try:
+        if op == 'eq':
+            return value == expected
+        if op == 'ne':
+            return value != expected
+        if op == 'in':
+            return value in expected
+        if value is None:
+            return False
+        if op == 'startswith':
+            return type(value) is str and value.startswith(expected)
+        if op == 'lt':
+            return value < expected
+        if op == 'lte':
+            return value <= expected
+        if op == 'gt':
+            return value > expected
+        return value >= expected
+    except TypeError:
+        return False
+
+
+def sort_key(attribute: str):
+    """ Key ordering objects by attribute, None last, then by id
+    """
+    def key(obj):
+        value = getattr(obj, attribute, None)
+        if value is None:
+            return (True, 0, obj.id)
+        return (False, value, obj.id)
+    return key
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+""" Lock module: reader-writer and inter-process file locks
+"""
+from contextlib import contextmanager
+import fcntl
+import os
+import threading
+
+
+class RWLock():
+    """ Lock shared by any number of readers or held by one writer
+    Waiting writers go first: new readers queue behind them, so a
+    steady stream of readers can't starve a writer
+    """
+
+    def __init__(self):
+        """ Initialize a free RWLock
+        """
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        """ Wait until there is no writer, then share the lock
+        """
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        """ Release a shared hold
+        """
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """ Wait until the lock is free, then hold it alone
+        """
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self):
+        """ Release the exclusive hold
+        """
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        """ Hold the lock shared for the with block
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        """ Hold the lock alone for the with block
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class FileLock():
+    """ Reentrant lock shared by the threads of this process and, through
+    flock() on lock_path, with other processes
+    """
+
+    def __init__(self, lock_path: str):
+        """ Initialize a FileLock on lock_path
+        """
+        self.lock_path = lock_path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        """ Wait for the lock, in this process then across processes
+        """
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            except BaseException:
+                self._lock.release()
+                raise
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                self._lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+
+    def release(self):
+        """ Release one hold, and the file lock with the last one
+        """
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+    def __enter__(self):
+        """ Acquire the lock for the with block
+        """
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        """ Release the lock at the end of the with block
+        """
+        self.release()
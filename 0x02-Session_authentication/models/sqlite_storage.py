@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+""" SQLite storage backend module
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, List, Optional, TypeVar
+import sqlite3
+import threading
+
+from models.codec import TIMESTAMP_FORMAT
+from models.query import matches, parse_order_by
+from models.storage import Storage
+
+
+class SQLiteStorage(Storage):
+    """ Stores each class in a table of the same name, one column per
+    attribute, with an index on every column of indexed_attributes
+    and sorted_attributes
+    The database is in WAL mode so several processes can share it
+    """
+
+    def __init__(self, db_path: str):
+        """ Initialize a SQLiteStorage on the database at db_path
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._columns = {}
+        self._columns_lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _quote(name: str) -> str:
+        """ SQL identifier of name
+        """
+        return '"{}"'.format(name.replace('"', '""'))
+
+    @staticmethod
+    def _value(value):
+        """ Column value of an attribute value
+        """
+        if type(value) is datetime:
+            return value.strftime(TIMESTAMP_FORMAT)
+        return value
+
+    def columns(self, cls: type) -> List[str]:
+        """ Columns of the table of cls, created with one column per
+        slot attribute if it doesn't exist
+        """
+        table = cls.__name__
+        columns = self._columns.get(table)
+        if columns is not None:
+            return columns
+        with self._columns_lock:
+            conn = self.connection
+            names = [name for name in cls.slot_attributes() if name != 'id']
+            conn.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(
+                self._quote(table), ", ".join(
+                    ["id TEXT PRIMARY KEY"] +
+                    [self._quote(name) for name in names])))
+            for name in dict.fromkeys(cls.indexed_attributes +
+                                      cls.sorted_attributes):
+                conn.execute("CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                    self._quote("{}_{}".format(table, name)),
+                    self._quote(table), self._quote(name)))
+            columns = [row[1] for row in conn.execute(
+                "PRAGMA table_info({})".format(self._quote(table)))]
+            self._columns[table] = columns
+        return columns
+
+    def _add_columns(self, cls: type, names: List[str]):
+        """ Add a column for each of names missing from the table
+        """
+        table = cls.__name__
+        with self._columns_lock:
+            columns = self._columns[table]
+            for name in names:
+                if name in columns:
+                    continue
+                try:
+                    self.connection.execute(
+                        "ALTER TABLE {} ADD COLUMN {}".format(
+                            self._quote(table), self._quote(name)))
+                except sqlite3.OperationalError:
+                    # added by another process since we read the table
+                    pass
+                columns = columns + [name]
+            self._columns[table] = columns
+
+    def _objects(self, cls: type, rows) -> Iterator[TypeVar('Base')]:
+        """ Objects of cls built from the rows of a SELECT *
+        """
+        columns = [d[0] for d in rows.description]
+        for row in rows:
+            yield cls(**dict(zip(columns, row)))
+
+    def load(self, cls: type):
+        """ Create the table of cls if needed
+        """
+        self.columns(cls)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update the row of obj
+        """
+        cls = obj.__class__
+        attributes = obj.to_json(True)
+        columns = self.columns(cls)
+        missing = [name for name in attributes if name not in columns]
+        if missing:
+            self._add_columns(cls, missing)
+        names = list(attributes)
+        self.connection.execute(
+            "INSERT INTO {} ({}) VALUES ({}) "
+            "ON CONFLICT(id) DO UPDATE SET {}".format(
+                self._quote(cls.__name__),
+                ", ".join(self._quote(name) for name in names),
+                ", ".join("?" for name in names),
+                ", ".join("{0} = excluded.{0}".format(self._quote(name))
+                          for name in names if name != 'id')),
+            [self._value(attributes[name]) for name in names])
+
+    def bulk_save(self, objs: List[TypeVar('Base')]):
+        """ Insert or update the rows of objs in one transaction
+        """
+        with self._transaction():
+            for obj in objs:
+                self.save(obj)
+
+    def bulk_remove(self, objs: List[TypeVar('Base')]):
+        """ Delete the rows of objs in one transaction
+        """
+        with self._transaction():
+            for obj in objs:
+                self.remove(obj)
+
+    @contextmanager
+    def _transaction(self):
+        """ Run the with block in a transaction, committed at its end
+        and rolled back on an exception
+        """
+        conn = self.connection
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete the row of obj
+        """
+        cls = obj.__class__
+        self.columns(cls)
+        self.connection.execute("DELETE FROM {} WHERE id = ?".format(
+            self._quote(cls.__name__)), (obj.id,))
+
+    def get(self, cls: type, obj_id: str) -> TypeVar('Base'):
+        """ Object of cls with obj_id, None if there is none
+        """
+        self.columns(cls)
+        rows = self.connection.execute("SELECT * FROM {} WHERE id = ?".format(
+            self._quote(cls.__name__)), (obj_id,))
+        return next(self._objects(cls, rows), None)
+
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Objects of cls whose columns equal the given values,
+        in insertion order
+        """
+        columns = self.columns(cls)
+        conditions = []
+        params = []
+        for name, value in attributes.items():
+            if name not in columns:
+                return []
+            if value is None:
+                conditions.append("{} IS NULL".format(self._quote(name)))
+            else:
+                conditions.append("{} = ?".format(self._quote(name)))
+                params.append(self._value(value))
+        query = "SELECT * FROM {}".format(self._quote(cls.__name__))
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY rowid"
+        return list(self._objects(cls, self.connection.execute(query,
+                                                               params)))
+
+    def query(self, cls: type, conditions: list, order_by: Optional[str],
+              limit: Optional[int], offset: int) -> List[TypeVar('Base')]:
+        """ Objects of cls matching conditions, with the conditions,
+        ordering and limits done by SQLite
+        """
+        columns = self.columns(cls)
+        clauses = []
+        params = []
+        for condition in conditions:
+            name = condition.attribute
+            op = condition.op
+            value = self._value(condition.value)
+            if name not in columns:
+                # no object has the attribute: it is None for all
+                if matches(condition, None):
+                    continue
+                return []
+            column = self._quote(name)
+            if op == 'in':
+                values = [self._value(v) for v in value if v is not None]
+                clause = "{} IN ({})".format(column,
+                                             ", ".join("?" for v in values))
+                if None in value:
+                    clause = "({} OR {} IS NULL)".format(clause, column)
+                clauses.append(clause)
+                params.extend(values)
+            elif op == 'startswith':
+                if type(value) is not str:
+                    return []
+                bound = _prefix_bound(value)
+                if bound is not None:
+                    clauses.append("{0} >= ? AND {0} < ?".format(column))
+                    params.extend([value, bound])
+                else:
+                    # no string follows every string starting with value
+                    clauses.append("typeof({0}) = 'text' AND {0} >= ?"
+                                   .format(column))
+                    params.append(value)
+            else:
+                if value is None and op not in ('eq', 'ne'):
+                    return []
+                sql_op = {'eq': 'IS', 'ne': 'IS NOT', 'lt': '<', 'lte': '<=',
+                          'gt': '>', 'gte': '>='}[op]
+                clauses.append("{} {} ?".format(column, sql_op))
+                params.append(value)
+        query = "SELECT * FROM {}".format(self._quote(cls.__name__))
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        if order_by:
+            name, reverse = parse_order_by(order_by)
+            desc = " DESC" if reverse else ""
+            if name in columns:
+                query += " ORDER BY {0} IS NULL{1}, {0}{1}, id{1}".format(
+                    self._quote(name), desc)
+            else:
+                query += " ORDER BY id{}".format(desc)
+        else:
+            query += " ORDER BY rowid"
+        query += " LIMIT ? OFFSET ?"
+        params.extend([-1 if limit is None else limit, offset])
+        return list(self._objects(cls, self.connection.execute(query,
+                                                               params)))
+
+    def count(self, cls: type) -> int:
+        """ Number of rows of cls
+        """
+        self.columns(cls)
+        return self.connection.execute("SELECT COUNT(*) FROM {}".format(
+            self._quote(cls.__name__))).fetchone()[0]
+
+    def iter_sorted(self, cls: type, cursor: Optional[str],
+                    limit: Optional[int]) -> Iterator[TypeVar('Base')]:
+        """ Objects of cls in ascending id order, read as they are
+        yielded
+        """
+        self.columns(cls)
+        rows = self.connection.execute(
+            "SELECT * FROM {} WHERE id > ? ORDER BY id LIMIT ?".format(
+                self._quote(cls.__name__)),
+            ("" if cursor is None else cursor,
+             -1 if limit is None else limit))
+        yield from self._objects(cls, rows)
+
+    def next_cursor(self, cls: type, cursor: Optional[str],
+                    limit: Optional[int]) -> Optional[str]:
+        """ Id of the last of the limit objects after cursor, None if
+        no object follows them
+        """
+        self.columns(cls)
+        ids = self.connection.execute(
+            "SELECT id FROM {} WHERE id > ? ORDER BY id "
+            "LIMIT 2 OFFSET ?".format(self._quote(cls.__name__)),
+            ("" if cursor is None else cursor, limit - 1)).fetchall()
+        if len(ids) < 2:
+            return None
+        return ids[0][0]
+
+
+def _prefix_bound(prefix: str) -> Optional[str]:
+    """ Smallest string greater than every string starting with prefix,
+    None if there is none (prefix empty or made of U+10FFFF only)
+    """
+    prefix = prefix.rstrip('\U0010ffff')
+    if not prefix:
+        return None
+    last = ord(prefix[-1]) + 1
+    if 0xd800 <= last <= 0xdfff:
+        # surrogates can't be stored: the next character is U+E000
+        last = 0xe000
+    return prefix[:-1] + chr(last)
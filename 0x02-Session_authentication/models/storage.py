@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+""" Storage module: the interface of the backends behind Base
+"""
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, TypeVar
+
+
+class Storage(ABC):
+    """ Storage backend
+    Base.load_from_file, save, remove, bulk_save, bulk_remove, get,
+    search, query, count, all, iter_sorted and next_cursor delegate
+    to the selected backend
+    """
+
+    def load(self, cls: type):
+        """ Prepare the storage of cls
+        """
+        pass
+
+    @abstractmethod
+    def save(self, obj: TypeVar('Base')):
+        """ Store obj, replacing any object with the same id
+        """
+
+    @abstractmethod
+    def remove(self, obj: TypeVar('Base')):
+        """ Remove the object with the id of obj, if any
+        """
+
+    def bulk_save(self, objs: List[TypeVar('Base')]):
+        """ Store every object of objs
+        """
+        for obj in objs:
+            self.save(obj)
+
+    def bulk_remove(self, objs: List[TypeVar('Base')]):
+        """ Remove every object of objs
+        """
+        for obj in objs:
+            self.remove(obj)
+
+    @abstractmethod
+    def get(self, cls: type, obj_id: str) -> TypeVar('Base'):
+        """ Object of cls with obj_id, None if there is none
+        """
+
+    @abstractmethod
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Objects of cls whose attributes equal the given values
+        """
+
+    @abstractmethod
+    def query(self, cls: type, conditions: list, order_by: Optional[str],
+              limit: Optional[int], offset: int) -> List[TypeVar('Base')]:
+        """ Objects of cls matching every condition (models.query),
+        ordered by order_by, after offset of them, at most limit
+        """
+
+    @abstractmethod
+    def count(self, cls: type) -> int:
+        """ Number of objects of cls
+        """
+
+    @abstractmethod
+    def iter_sorted(self, cls: type, cursor: Optional[str],
+                    limit: Optional[int]) -> Iterator[TypeVar('Base')]:
+        """ Objects of cls in ascending id order, after the id cursor,
+        at most limit of them
+        """
+
+    @abstractmethod
+    def next_cursor(self, cls: type, cursor: Optional[str],
+                    limit: Optional[int]) -> Optional[str]:
+        """ Id of the last of the limit objects after cursor, None if
+        no object follows them
+        """
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+""" Move the User files to another number of shards
+Usage: ./reshard.py <shards>
+Stop the API first; the number of shards is recorded in .db_User.shards,
+so it needs no setting when the API starts again
+"""
+import sys
+
+from models.user import User
+
+
+if len(sys.argv) != 2 or not sys.argv[1].isdigit() or int(sys.argv[1]) < 1:
+    print("Usage: {} <shards>".format(sys.argv[0]))
+    sys.exit(1)
+
+shards = int(sys.argv[1])
+User.reshard(shards)
+print("{} users in {} shards".format(User.count(), shards))